@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def recipe_key(recipe_id):
+    return f"recipe-representation:{recipe_id}"
+
+
+def recipe_version(recipe):
+    return recipe.updated_at, recipe.author.updated_at
+
+
+def entry_data(recipe, entry):
+    # Запись, сохранённая по устаревшему экземпляру (например, до окончания
+    # фоновой обработки изображения), не совпадет с ним по версии.
+    if entry is not None and entry[0] == recipe_version(recipe):
+        return entry[1]
+    return None
+
+
+def get_recipe(recipe):
+    return entry_data(recipe, cache.get(recipe_key(recipe.pk)))
+
+
+def get_recipes(recipes):
+    """Представления нескольких рецептов одним запросом к кешу: {id: данные}."""
+    entries = cache.get_many([recipe_key(recipe.pk) for recipe in recipes])
+    result = {}
+    for recipe in recipes:
+        data = entry_data(recipe, entries.get(recipe_key(recipe.pk)))
+        if data is not None:
+            result[recipe.pk] = data
+    return result
+
+
+def set_recipe(recipe, data):
+    set_recipes([(recipe, data)])
+
+
+def set_recipes(items):
+    """Сохраняет пары (рецепт, представление) одним запросом к кешу."""
+    if items:
+        cache.set_many(
+            {
+                recipe_key(recipe.pk): (recipe_version(recipe), data)
+                for recipe, data in items
+            },
+            settings.RECIPE_CACHE_TIMEOUT,
+        )
+
+
+def invalidate_recipes(recipe_ids):
+    keys = [recipe_key(recipe_id) for recipe_id in recipe_ids]
+    # Удаляем после коммита, чтобы параллельный запрос не закешировал
+    # старое состояние, пока транзакция еще не завершена.
+    transaction.on_commit(lambda: cache.delete_many(keys))
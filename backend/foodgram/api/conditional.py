@@ -0,0 +1,32 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(request, *parts):
+    digest = hashlib.sha256(
+        repr((request.build_absolute_uri(), parts)).encode()
+    ).hexdigest()
+    return quote_etag(digest)
+
+
+def conditional_response(request, etag, last_modified, build, check_modified=False):
+    """Отвечает 304, если у клиента актуальная версия, иначе вызывает build.
+
+    If-Modified-Since учитывается только при check_modified: признаки
+    избранного и подписки меняются без изменения updated_at, поэтому
+    дата - надежный валидатор лишь для ответов, не зависящих от пользователя.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=timestamp if check_modified else None,
+    )
+    if response is None:
+        response = build()
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    return response
@@ -0,0 +1,35 @@
+from django import forms
+from django_filters import rest_framework as filters
+
+from recipes.models import Recipe
+
+
+class IntegerFilter(filters.Filter):
+    field_class = forms.IntegerField
+
+
+class IntegerInFilter(filters.BaseInFilter, IntegerFilter):
+    pass
+
+
+class RecipeFilter(filters.FilterSet):
+    """Фильтры рецептов по автору, времени приготовления и ингредиентам.
+
+    Ингредиенты передаются списком идентификаторов через запятую и
+    проверяются по GIN-индексу поля ingredient_ids.
+    """
+
+    cooking_time = filters.RangeFilter()
+    ingredients_all = IntegerInFilter(
+        field_name="ingredient_ids", lookup_expr="contains"
+    )
+    ingredients_any = IntegerInFilter(
+        field_name="ingredient_ids", lookup_expr="overlap"
+    )
+    ingredients_exclude = IntegerInFilter(
+        field_name="ingredient_ids", lookup_expr="overlap", exclude=True
+    )
+
+    class Meta:
+        model = Recipe
+        fields = ("author",)
@@ -0,0 +1,131 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from PIL import Image, ImageOps
+
+from recipes import files
+from recipes.models import ImageJob, Recipe
+
+from .cache import invalidate_recipes
+
+
+logger = logging.getLogger(__name__)
+
+# Варианты изображения: имя -> наибольшая сторона в пикселях.
+# Вариант full заменяет загруженный оригинал: без EXIF и в WebP.
+VARIANTS = {
+    "image": {"full": 2048, "thumb": 320, "medium": 960},
+    "avatar": {"full": 1024, "thumb": 128},
+}
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        with executor_lock:
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    settings.IMAGE_WORKERS, thread_name_prefix="images"
+                )
+    return executor
+
+
+def needs_processing(instance, field):
+    """Загружен ли новый файл в поле field (или поле очищено)."""
+    return field in getattr(instance, "changed_files", ())
+
+
+def schedule(instance, field):
+    """Ставит обработку изображения в очередь после фиксации транзакции.
+
+    Задание записывается в ImageJob в той же транзакции, что и файл.
+    """
+    label, name = instance._meta.label, getattr(instance, field).name or ""
+    ImageJob.objects.bulk_create(
+        [ImageJob(label=label, object_id=instance.pk, field=field, name=name)],
+        update_conflicts=True,
+        unique_fields=["label", "object_id", "field"],
+        update_fields=["name", "attempts", "error"],
+    )
+    job = partial(run, label, instance.pk, field, name)
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(job))
+    else:
+        transaction.on_commit(job)
+
+
+def run(label, pk, field, name):
+    """Выполняет задание; успешное удаляет, неудачное отмечает ошибкой."""
+    close_old_connections()
+    # Задание новой загрузки (с другим name) остается в очереди.
+    jobs = ImageJob.objects.filter(label=label, object_id=pk, field=field, name=name)
+    try:
+        process(apps.get_model(label), pk, field)
+    except Exception as error:
+        logger.exception("Не удалось обработать изображение %s %s", label, pk)
+        jobs.update(attempts=F("attempts") + 1, error=repr(error))
+        return False
+    else:
+        jobs.delete()
+        return True
+    finally:
+        close_old_connections()
+
+
+def encode(image, size):
+    image = image.copy()
+    image.thumbnail((size, size))
+    content = io.BytesIO()
+    image.save(content, "WEBP", quality=80, method=4)
+    return ContentFile(content.getvalue())
+
+
+def process(model, pk, field):
+    columns = [f"{field}_{variant}" for variant in VARIANTS[field] if variant != "full"]
+    name = model.objects.filter(pk=pk).values_list(field, flat=True).first()
+    new = dict.fromkeys(columns, "")
+    if name:
+        with default_storage.open(name) as file, Image.open(file) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+            for variant, size in VARIANTS[field].items():
+                key = field if variant == "full" else f"{field}_{variant}"
+                upload_to = model._meta.get_field(key).upload_to
+                new[key] = default_storage.save(
+                    f"{upload_to}/{variant}.webp", encode(image, size)
+                )
+
+    with transaction.atomic():
+        old = (
+            model.objects.select_for_update()
+            .filter(pk=pk, **{field: name})
+            .values(field, *columns)
+            .first()
+        )
+        files.acquire(new.values())
+        if old is None:
+            # Файл успели заменить: новые варианты никому не нужны.
+            files.release(new.values())
+            return
+        model.objects.filter(pk=pk).update(**new, updated_at=Now())
+        files.release(old[key] for key in new)
+    if model is Recipe:
+        invalidate_recipes([pk])
+    else:
+        invalidate_recipes(
+            Recipe.objects.filter(author_id=pk).values_list("id", flat=True)
+        )
@@ -0,0 +1,224 @@
+import bisect
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count
+
+from recipes.models import DataVersion, Ingredient
+
+
+RESULTS_CACHE_SIZE = 1024
+
+
+def pattern_masks(query):
+    masks = {}
+    for position, char in enumerate(query):
+        masks[char] = masks.get(char, 0) | 1 << position
+    return masks
+
+
+def prefix_distance(masks, length, name):
+    """Расстояние Левенштейна от запроса до ближайшего префикса name.
+
+    Битово-параллельный алгоритм Майерса: столбец таблицы расстояний
+    хранится как разности соседних ячеек в двух масках длины запроса.
+    """
+    full = (1 << length) - 1
+    high = 1 << (length - 1)
+    vp, vn = full, 0
+    score = best = length
+    for char in name:
+        eq = masks.get(char, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        hp = vn | ~(xh | vp)
+        hn = vp & xh
+        if hp & high:
+            score += 1
+        elif hn & high:
+            score -= 1
+        hp = ((hp << 1) | 1) & full
+        hn = (hn << 1) & full
+        vp = (hn | ~(xv | hp)) & full
+        vn = hp & xv
+        best = min(best, score)
+    return best
+
+
+class IngredientSnapshot:
+    """Данные об ингредиентах, собранные в памяти процесса.
+
+    Пересобираются при смене версии ингредиентов в базе и, если задан
+    параметр ttl_setting, по истечении этого времени.
+    """
+
+    ttl_setting = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.built_at = None
+
+    def is_stale(self, version):
+        if self.built_at is None or version != self.version:
+            return True
+        ttl = getattr(settings, self.ttl_setting) if self.ttl_setting else None
+        return ttl is not None and time.monotonic() - self.built_at > ttl
+
+    def ensure_fresh(self):
+        version = DataVersion.objects.get_value(DataVersion.INGREDIENTS)
+        if self.is_stale(version):
+            with self.lock:
+                if self.is_stale(version):
+                    self.build()
+                    self.version = version
+                    self.built_at = time.monotonic()
+
+    def build(self):
+        raise NotImplementedError
+
+
+class IngredientMatcher:
+    """Неизменяемые данные индекса автодополнения одной сборки."""
+
+    def __init__(self, rows):
+        # Позиция ингредиента в списке - его ранг по популярности.
+        self.items = [
+            {"id": pk, "name": name, "measurement_unit": unit}
+            for pk, name, unit in rows
+        ]
+        self.names = [item["name"].lower() for item in self.items]
+        order = sorted(range(len(self.names)), key=self.names.__getitem__)
+        self.sorted_names = [self.names[index] for index in order]
+        self.sorted_ranks = order
+        self.starts = []
+        offset = 0
+        for name in self.names:
+            self.starts.append(offset)
+            offset += len(name) + 1
+        self.blob = "\n".join(self.names)
+        self.results = {}
+
+    def search(self, query, limit):
+        key = (query, limit)
+        result = self.results.get(key)
+        if result is None:
+            if len(self.results) >= RESULTS_CACHE_SIZE:
+                self.results.pop(next(iter(self.results), None), None)
+            result = self.results[key] = self.find_matches(query, limit)
+        return result
+
+    def find_matches(self, query, limit):
+        result = []
+        found = set()
+        for matcher, min_length in (
+            (self.match_prefix, 1),
+            (self.match_substring, 2),
+            (self.match_typos, 4),
+        ):
+            if len(result) >= limit or len(query) < min_length:
+                break
+            for rank in matcher(query):
+                if rank not in found:
+                    found.add(rank)
+                    result.append(rank)
+        return [self.items[rank] for rank in result[:limit]]
+
+    def match_prefix(self, query):
+        start = bisect.bisect_left(self.sorted_names, query)
+        end = bisect.bisect_left(self.sorted_names, query + "\uffff", start)
+        return sorted(self.sorted_ranks[start:end])
+
+    def find(self, piece, offsets=None):
+        """Ранги названий, содержащих piece (со смещением из offsets)."""
+        ranks = []
+        position = self.blob.find(piece)
+        while position != -1:
+            rank = bisect.bisect_right(self.starts, position) - 1
+            if offsets is None or position - self.starts[rank] in offsets:
+                ranks.append(rank)
+            position = self.blob.find(piece, position + 1)
+        return ranks
+
+    def match_substring(self, query):
+        return sorted(set(self.find(query)))
+
+    def match_typos(self, query):
+        limit = 1 if len(query) < 8 else 2
+        width = len(query) + limit
+        # При limit опечатках хотя бы один из limit + 1 кусков запроса
+        # входит в начало названия без изменений и сдвинут не больше чем
+        # на limit: остальные названия можно не сравнивать.
+        size = len(query) // (limit + 1)
+        candidates = set()
+        for index in range(limit + 1):
+            start = index * size
+            end = start + size if index < limit else len(query)
+            offsets = range(max(start - limit, 0), start + limit + 1)
+            candidates.update(self.find(query[start:end], offsets))
+        masks = pattern_masks(query)
+        matches = []
+        for rank in candidates:
+            distance = prefix_distance(masks, len(query), self.names[rank][:width])
+            if distance <= limit:
+                matches.append((distance, rank))
+        return [rank for _, rank in sorted(matches)]
+
+
+class IngredientIndex(IngredientSnapshot):
+    """Индекс ингредиентов для автодополнения.
+
+    Совпадения выдаются по группам: сначала по началу названия, затем
+    по подстроке, затем с опечатками. Внутри группы ингредиенты упорядочены
+    по числу рецептов, в которых они используются.
+    """
+
+    ttl_setting = "INGREDIENT_INDEX_TTL"
+
+    def build(self):
+        rows = (
+            Ingredient.objects.annotate(uses=Count("recipeingredient"))
+            .order_by("-uses", "name", "id")
+            .values_list("id", "name", "measurement_unit")
+        )
+        # Сборка идёт отдельно и подменяется одним присваиванием: поиск
+        # в других потоках до замены читает прежние данные.
+        self.matcher = IngredientMatcher(rows)
+
+    def search(self, query, limit=None):
+        """Не больше limit (по умолчанию INGREDIENT_SEARCH_LIMIT) совпадений."""
+        self.ensure_fresh()
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        return self.matcher.search(query.strip().lower(), limit)
+
+
+def encode(data):
+    content = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+    return content, f'"{hashlib.sha256(content).hexdigest()}"'
+
+
+class IngredientCatalog(IngredientSnapshot):
+    """Готовые JSON-ответы со списком ингредиентов и с каждым ингредиентом.
+
+    ETag - хеш содержимого, поэтому он не меняется, пока не изменится
+    сам каталог.
+    """
+
+    def build(self):
+        items = list(Ingredient.objects.values("id", "name", "measurement_unit"))
+        self.snapshot = (encode(items), {item["id"]: encode(item) for item in items})
+
+    def get_catalog(self):
+        self.ensure_fresh()
+        return self.snapshot[0]
+
+    def get_detail(self, pk):
+        self.ensure_fresh()
+        return self.snapshot[1].get(pk)
+
+
+ingredient_index = IngredientIndex()
+ingredient_catalog = IngredientCatalog()
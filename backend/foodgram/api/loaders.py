@@ -0,0 +1,33 @@
+class RequestLoader:
+    """Данные о пользователях, общие для всех сериализаторов запроса."""
+
+    def __init__(self, user):
+        self.user = user
+        self.representations = {}
+        self._following_ids = None
+
+    @property
+    def following_ids(self):
+        if self._following_ids is None:
+            self._following_ids = set(
+                self.user.follower.values_list("following_id", flat=True)
+            )
+        return self._following_ids
+
+    def is_subscribed(self, user_id):
+        if not self.user.is_authenticated or user_id == self.user.id:
+            return False
+        return user_id in self.following_ids
+
+    def represent(self, serializer, instance, build):
+        key = (type(serializer), instance.pk)
+        if key not in self.representations:
+            self.representations[key] = build(instance)
+        return self.representations[key]
+
+
+def get_loader(request):
+    loader = getattr(request, "foodgram_loader", None)
+    if loader is None:
+        loader = request.foodgram_loader = RequestLoader(request.user)
+    return loader
@@ -0,0 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api import images
+from recipes.models import ImageJob, Recipe
+
+
+User = get_user_model()
+
+# Модель и поле изображения с вариантами.
+IMAGE_FIELDS = ((Recipe, "image"), (User, "avatar"))
+
+
+class Command(BaseCommand):
+    help = (
+        "Обрабатывает изображения из очереди ImageJob: потерянные при "
+        "перезапуске процесса и завершившиеся ошибкой."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=5,
+            help="Пропускать задания, не выполненные столько раз.",
+        )
+        parser.add_argument(
+            "--missing",
+            action="store_true",
+            help="Сначала поставить в очередь изображения без вариантов.",
+        )
+
+    def handle(self, max_attempts, missing, **options):
+        if missing:
+            for model, field in IMAGE_FIELDS:
+                self.enqueue_missing(model, field)
+
+        done = failed = 0
+        # Список читается целиком: run() закрывает соединение с базой.
+        for job in list(ImageJob.objects.filter(attempts__lt=max_attempts)):
+            if images.run(job.label, job.object_id, job.field, job.name):
+                done += 1
+            else:
+                failed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Обработано изображений: {done}, с ошибкой: {failed}.")
+        )
+
+    def enqueue_missing(self, model, field):
+        # Вариант thumb есть у каждого поля: без него изображение не обработано.
+        rows = (
+            model.objects.filter(~Q(**{field: ""}), **{f"{field}_thumb": ""})
+            .values_list("pk", field)
+            .iterator()
+        )
+        ImageJob.objects.bulk_create(
+            (
+                ImageJob(label=model._meta.label, object_id=pk, field=field, name=name)
+                for pk, name in rows
+            ),
+            ignore_conflicts=True,
+        )
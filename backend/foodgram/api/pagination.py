@@ -0,0 +1,116 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RecipePagination(LimitOffsetPagination):
+    """Постраничный вывод рецептов.
+
+    По умолчанию - limit/offset. Если в запросе есть параметр cursor
+    (в том числе пустой), страницы выбираются по ключу (pub_date, id):
+    стоимость любой страницы одинакова, COUNT(*) не выполняется.
+    Представление может задать другие поля ключа атрибутом keyset_fields.
+    """
+
+    cursor_query_param = "cursor"
+    keyset_fields = ("pub_date", "id")
+    invalid_cursor_message = "Неверный курсор."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.fields = getattr(view, "keyset_fields", self.keyset_fields)
+        date_field, id_field = self.fields
+        self.count = None
+        self.limit = self.get_limit(request)
+        reverse, position = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+
+        if reverse:
+            queryset = queryset.order_by(date_field, id_field)
+        else:
+            queryset = queryset.order_by(f"-{date_field}", f"-{id_field}")
+        if position is not None:
+            pub_date, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(**{f"{date_field}__gte": pub_date}),
+                    Q(**{f"{date_field}__gt": pub_date}) | Q(**{f"{id_field}__gt": pk}),
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(**{f"{date_field}__lte": pub_date}),
+                    Q(**{f"{date_field}__lt": pub_date}) | Q(**{f"{id_field}__lt": pk}),
+                )
+
+        results = list(queryset[: self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[: self.limit]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            if has_more or reverse:
+                self.next_position = results[-1]
+            if has_more if reverse else position is not None:
+                self.previous_position = results[0]
+        return results
+
+    def decode_cursor(self, value):
+        if not value:
+            return False, None
+        try:
+            direction, pub_date, pk = (
+                base64.urlsafe_b64decode(value.encode()).decode().split("|")
+            )
+            return direction == "p", (datetime.fromisoformat(pub_date), int(pk))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, direction, recipe):
+        date_field, id_field = self.fields
+        pub_date, pk = getattr(recipe, date_field), getattr(recipe, id_field)
+        value = f"{direction}|{pub_date.isoformat()}|{pk}"
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            base64.urlsafe_b64encode(value.encode()).decode(),
+        )
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return self.encode_cursor("n", self.next_position)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor("p", self.previous_position)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "count": self.count,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
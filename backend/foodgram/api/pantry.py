@@ -0,0 +1,152 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from recipes import sync
+from recipes.models import Recipe
+
+
+class PantryIndex:
+    """Матрица рецепт x ингредиент в сжатом построчном формате (CSR).
+
+    Ингредиенты рецепта recipe_ids[i] - indices[indptr[i]:indptr[i + 1]].
+    Изменённые рецепты дописываются новыми строками, старые строки
+    помечаются мёртвыми; когда мёртвых становится больше половины,
+    матрица уплотняется.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.matrix = (
+            np.zeros(0, np.int64),
+            np.zeros(1, np.int64),
+            np.zeros(0, np.int64),
+            np.zeros(0, bool),
+        )
+        self.rows = {}
+        self.synced_at = None
+        self.full_synced_at = None
+        self.checked_at = None
+
+    def invalidate(self):
+        with self.lock:
+            self.reset()
+
+    def is_stale(self, state):
+        return (
+            state["synced_at"] != self.synced_at
+            or state["count"] != len(self.rows)
+            or sync.full_read_due(self.full_synced_at)
+        )
+
+    def check_due(self):
+        return (
+            self.checked_at is None
+            or time.monotonic() - self.checked_at > settings.PANTRY_CHECK_INTERVAL
+        )
+
+    def sync(self):
+        # Подсчет рецептов проходит по всей таблице: он выполняется не чаще
+        # раза в PANTRY_CHECK_INTERVAL секунд.
+        if not self.check_due():
+            return
+        self.checked_at = time.monotonic()
+        state = Recipe.objects.aggregate(count=Count("id"), synced_at=Max("updated_at"))
+        if not self.is_stale(state):
+            return
+        with self.lock:
+            if not self.is_stale(state):
+                return
+            since = sync.read_from(self.synced_at, self.full_synced_at)
+            # Удалённые рецепты не найти по updated_at.
+            if since is None or len(self.rows) > state["count"]:
+                self.rebuild()
+            else:
+                self.append(
+                    Recipe.objects.order_by()
+                    .filter(updated_at__gte=since)
+                    .values_list("id", "ingredient_ids")
+                )
+                if len(self.rows) != state["count"]:
+                    self.rebuild()
+            self.synced_at = state["synced_at"]
+
+    def rebuild(self):
+        # Новая матрица собирается отдельно: match() в других потоках
+        # до замены читает прежнюю.
+        fresh = PantryIndex()
+        fresh.append(Recipe.objects.values_list("id", "ingredient_ids"))
+        self.matrix, self.rows = fresh.matrix, fresh.rows
+        self.full_synced_at = timezone.now()
+
+    def append(self, recipes):
+        recipe_ids, indptr, indices, alive = self.matrix
+        alive = alive.copy()
+        changed = []
+        for recipe_id, ingredient_ids in recipes:
+            row = self.rows.get(recipe_id)
+            if row is not None:
+                if indices[indptr[row] : indptr[row + 1]].tolist() == ingredient_ids:
+                    continue
+                alive[row] = False
+            self.rows[recipe_id] = len(recipe_ids) + len(changed)
+            changed.append((recipe_id, ingredient_ids))
+        if not changed:
+            return
+        sizes = np.fromiter((len(ids) for _, ids in changed), np.int64, len(changed))
+        self.matrix = (
+            np.concatenate(
+                (recipe_ids, np.fromiter((pk for pk, _ in changed), np.int64))
+            ),
+            np.concatenate((indptr, indptr[-1] + np.cumsum(sizes))),
+            np.concatenate(
+                (indices, np.fromiter((i for _, ids in changed for i in ids), np.int64))
+            ),
+            np.concatenate((alive, np.ones(len(changed), bool))),
+        )
+        if len(self.matrix[0]) > 2 * len(self.rows):
+            self.compact()
+
+    def compact(self):
+        recipe_ids, indptr, indices, alive = self.matrix
+        sizes = np.diff(indptr)
+        self.matrix = (
+            recipe_ids[alive],
+            np.concatenate(([0], np.cumsum(sizes[alive]))),
+            indices[np.repeat(alive, sizes)],
+            np.ones(np.count_nonzero(alive), bool),
+        )
+        self.rows = {pk: row for row, pk in enumerate(self.matrix[0].tolist())}
+
+    def match(self, ingredient_ids, limit):
+        """Рецепты с наибольшей долей имеющихся ингредиентов.
+
+        Возвращает пары (id рецепта, доля) по убыванию доли для рецептов,
+        в которых есть хотя бы один из ingredient_ids.
+        """
+        self.sync()
+        recipe_ids, indptr, indices, alive = self.matrix
+        size = indices.max(initial=0) + 1
+        owned_ids = np.fromiter(ingredient_ids, np.int64)
+        owned = np.zeros(size, bool)
+        owned[owned_ids[owned_ids < size]] = True
+        found = np.concatenate(([0], np.cumsum(owned[indices])))
+        hits = found[indptr[1:]] - found[indptr[:-1]]
+        sizes = np.diff(indptr)
+        rows = np.flatnonzero(alive & (hits > 0))
+        coverage = hits[rows] / sizes[rows]
+        missing = sizes[rows] - hits[rows]
+        order = rows[np.lexsort((-recipe_ids[rows], missing, -coverage))[:limit]]
+        return list(
+            zip(recipe_ids[order].tolist(), (hits[order] / sizes[order]).tolist())
+        )
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,20 @@
+import mimetypes
+
+from rest_framework.parsers import FileUploadParser
+
+
+class ImageUploadParser(FileUploadParser):
+    """Изображение в теле запроса как есть (Content-Type: image/...).
+
+    Тело читается обработчиками загрузки Django по частям, файл
+    доступен в request.data["file"].
+    """
+
+    media_type = "image/*"
+
+    def get_filename(self, stream, media_type, parser_context):
+        filename = super().get_filename(stream, media_type, parser_context)
+        if filename:
+            return filename
+        extension = mimetypes.guess_extension(media_type.split(";")[0].strip())
+        return "upload" + (extension or "")
@@ -1,20 +1,41 @@
 import base64
+import json
 
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
+from django.db import models, transaction
 
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Featured, ShoppingList
+from recipes import shopping_cart
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    Featured,
+    ShoppingCartItem,
+    ShoppingList,
+)
+
+from . import cache
+from .loaders import get_loader
 
 
 MIN_NUMBER = 1
 MAX_NUMBER = 32000
+MAX_BULK_SIZE = 500
 
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get("recipes_limit")
+    if recipes_limit is not None and recipes_limit.isdigit():
+        return int(recipes_limit)
+    return None
+
+
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith("data:image"):
@@ -25,10 +46,14 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+class AvatarSerializer(serializers.Serializer):
+    avatar = Base64ImageField()
+
+
 class ShortRecipeOutputSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_thumb", "cooking_time")
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -47,24 +72,13 @@ class IsSubscribed(serializers.Serializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        user = self.context["request"].user
-        if user.is_authenticated:
-            return user.follower.filter(following=obj).exists()
-        return False
-
+        return get_loader(self.context["request"]).is_subscribed(obj.pk)
 
-class FollowSerializer(serializers.Serializer):
-    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
-    following = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
-
-    def validate(self, attrs):
-        user = attrs["user"]
-        following = attrs["following"]
-        if user == following:
-            raise serializers.ValidationError("Нельзя подписаться на самого себя.")
-        if user.follower.filter(following=following).exists():
-            raise serializers.ValidationError("Повторная подписка невозможна.")
-        return attrs
+    def to_representation(self, instance):
+        # Один и тот же автор сериализуется один раз за запрос.
+        return get_loader(self.context["request"]).represent(
+            self, instance, super().to_representation
+        )
 
 
 class CustomUserSerializer(UserSerializer, IsSubscribed):
@@ -84,21 +98,25 @@ class CustomUserSerializer(UserSerializer, IsSubscribed):
             "recipes",
             "recipes_count",
             "avatar",
+            "avatar_thumb",
         )
 
     def get_recipes(self, obj):
         request = self.context.get("request")
-        queryset = obj.recipes.all()
-        recipes_limit = request.query_params.get("recipes_limit")
-        if recipes_limit is not None and recipes_limit.isdigit():
-            queryset = queryset[: int(recipes_limit)]
+        # Список подписок подгружает превью рецептов заранее.
+        queryset = getattr(obj, "recipe_previews", None)
+        if queryset is None:
+            queryset = obj.recipes.all()
+            recipes_limit = get_recipes_limit(request)
+            if recipes_limit is not None:
+                queryset = queryset[:recipes_limit]
         serializer = ShortRecipeOutputSerializer(
             queryset, many=True, context={"request": request}
         )
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
 
 
 class ShortUserSerializer(UserSerializer, IsSubscribed):
@@ -114,6 +132,7 @@ class ShortUserSerializer(UserSerializer, IsSubscribed):
             "last_name",
             "is_subscribed",
             "avatar",
+            "avatar_thumb",
         )
 
 
@@ -124,7 +143,8 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientInputSerializer(serializers.Serializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    # Существование ингредиентов проверяет RecipeSerializer одним запросом.
+    id = serializers.IntegerField(min_value=1)
     amount = serializers.IntegerField(
         min_value=MIN_NUMBER,
         max_value=MAX_NUMBER,
@@ -141,8 +161,82 @@ class IngredientOutputSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
+class ShoppingCartItemSerializer(IngredientOutputSerializer):
+    class Meta:
+        model = ShoppingCartItem
+        fields = ("id", "name", "measurement_unit", "amount")
+
+
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=MIN_NUMBER), allow_empty=False
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class BulkSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=MIN_NUMBER),
+        allow_empty=False,
+        max_length=MAX_BULK_SIZE,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+    def validate(self, attrs):
+        unknown = set(self.initial_data) - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError(
+                f"Неизвестные поля: {', '.join(sorted(unknown))}."
+            )
+        return attrs
+
+
+class PantryRecipeSerializer(ShortRecipeOutputSerializer):
+    coverage = serializers.FloatField()
+    missing = IngredientOutputSerializer(many=True)
+
+    class Meta(ShortRecipeOutputSerializer.Meta):
+        fields = (*ShortRecipeOutputSerializer.Meta.fields, "coverage", "missing")
+
+
+RECIPE_IMAGES = ("image", "image_thumb", "image_medium")
+AUTHOR_IMAGES = ("avatar", "avatar_thumb")
+
+
+def file_urls(instance, fields):
+    return {
+        field: getattr(instance, field).url if getattr(instance, field) else None
+        for field in fields
+    }
+
+
+def absolute_urls(request, data, fields):
+    return {
+        field: data[field] and request.build_absolute_uri(data[field])
+        for field in fields
+    }
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов, читающий и пишущий кеш одним запросом на страницу."""
+
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        recipes = list(data)
+        self.child.batch = {"cached": cache.get_recipes(recipes), "missed": []}
+        try:
+            result = super().to_representation(recipes)
+            cache.set_recipes(self.child.batch["missed"])
+        finally:
+            self.child.batch = None
+        return result
+
+
 class RecipeOutputSerializer(serializers.ModelSerializer):
-    ingredients = IngredientOutputSerializer(source="recipe_ingredients", many=True)
+    ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     author = ShortUserSerializer()
@@ -157,23 +251,85 @@ class RecipeOutputSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_thumb",
+            "image_medium",
             "text",
             "cooking_time",
         )
         read_only_fields = ("author",)
+        list_serializer_class = RecipeListSerializer
+
+    # Кеш страницы, заполняемый RecipeListSerializer.
+    batch = None
 
     def item_is_in_queryset(self, user, model, recipe):
         if not user.is_authenticated:
             return False
         return model.objects.filter(user=user, recipe=recipe).exists()
 
+    def get_flag(self, obj, attr, model):
+        # Признак берется из аннотации queryset, запрос - только без нее.
+        value = getattr(obj, attr, None)
+        if value is None:
+            value = self.item_is_in_queryset(self.context["request"].user, model, obj)
+        return value
+
+    def get_ingredients(self, obj):
+        # Только что записанные строки передаются атрибутом ingredient_rows.
+        rows = getattr(obj, "ingredient_rows", None)
+        if rows is None:
+            rows = obj.recipe_ingredients.all()
+        return IngredientOutputSerializer(rows, many=True, context=self.context).data
+
     def get_is_favorited(self, obj):
-        user = self.context["request"].user
-        return self.item_is_in_queryset(user, Featured, obj)
+        return self.get_flag(obj, "is_favorited", Featured)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context["request"].user
-        return self.item_is_in_queryset(user, ShoppingList, obj)
+        return self.get_flag(obj, "is_in_shopping_cart", ShoppingList)
+
+    def to_representation(self, instance):
+        # В кеше хранится часть, общая для всех пользователей: без признаков
+        # избранного и подписки и с относительными ссылками на изображения.
+        if self.batch is None:
+            data = cache.get_recipe(instance)
+        else:
+            data = self.batch["cached"].get(instance.pk)
+        if data is None:
+            data = super().to_representation(instance)
+            data = {
+                **data,
+                "author": {
+                    **data["author"],
+                    "is_subscribed": None,
+                    **file_urls(instance.author, AUTHOR_IMAGES),
+                },
+                "is_favorited": None,
+                "is_in_shopping_cart": None,
+                **file_urls(instance, RECIPE_IMAGES),
+            }
+            if self.batch is None:
+                cache.set_recipe(instance, data)
+            else:
+                self.batch["missed"].append((instance, data))
+        return self.personalize(instance, data)
+
+    def personalize(self, instance, data):
+        request = self.context["request"]
+        author = data["author"]
+        data = {
+            **data,
+            "author": {
+                **author,
+                "is_subscribed": get_loader(request).is_subscribed(author["id"]),
+                **absolute_urls(request, author, AUTHOR_IMAGES),
+            },
+            "is_favorited": self.get_is_favorited(instance),
+            "is_in_shopping_cart": self.get_is_in_shopping_cart(instance),
+            **absolute_urls(request, data, RECIPE_IMAGES),
+        }
+        if hasattr(instance, "search_snippet"):
+            data["search_snippet"] = instance.search_snippet
+        return data
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -197,6 +353,18 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ("author",)
 
+    def to_internal_value(self, data):
+        # В multipart/form-data список ингредиентов передается JSON-строкой.
+        if hasattr(data, "getlist") and isinstance(data.get("ingredients"), str):
+            try:
+                ingredients = json.loads(data["ingredients"])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {"ingredients": ["Ожидается список в формате JSON."]}
+                )
+            data = {**data.dict(), "ingredients": ingredients}
+        return super().to_internal_value(data)
+
     def create_ingredients(self, recipe, ingredients):
         recipe_ingredients = [
             RecipeIngredient(
@@ -204,7 +372,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             )
             for ingredient in ingredients
         ]
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        return RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
     def validate_ingredients(self, value):
         if not value:
@@ -212,26 +380,96 @@ class RecipeSerializer(serializers.ModelSerializer):
         ingredients_id = {ingredient.get("id") for ingredient in value}
         if len(ingredients_id) != len(value):
             raise serializers.ValidationError("Ингредиенты не должны повторяться.")
-        return value
+        found = Ingredient.objects.in_bulk(ingredients_id)
+        missing = sorted(ingredients_id - found.keys())
+        if missing:
+            raise serializers.ValidationError(
+                f"Ингредиенты не найдены: {', '.join(map(str, missing))}."
+            )
+        return [{**ingredient, "id": found[ingredient["id"]]} for ingredient in value]
+
+    @staticmethod
+    def get_ingredient_ids(ingredients):
+        return sorted(ingredient["id"].pk for ingredient in ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop("ingredients")
-        recipe = Recipe.objects.create(**validated_data)
-        self.create_ingredients(recipe, ingredients)
+        recipe = Recipe.objects.create(
+            **validated_data, ingredient_ids=self.get_ingredient_ids(ingredients)
+        )
+        self.recipe_ingredients = self.create_ingredients(recipe, ingredients)
+        recipe.is_favorited = recipe.is_in_shopping_cart = False
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop("ingredients", None)
         if ingredients is None:
             raise serializers.ValidationError("ingredients - обязательное поле.")
 
-        instance.recipe_ingredients.all().delete()
-
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
+        instance.ingredient_ids = self.get_ingredient_ids(ingredients)
         instance.save()
-        self.create_ingredients(instance, ingredients)
+        self.recipe_ingredients = self.update_ingredients(instance, ingredients)
+        cache.invalidate_recipes([instance.pk])
         return instance
 
+    def update_ingredients(self, recipe, ingredients):
+        """Приводит ингредиенты рецепта к ingredients.
+
+        Пишет только добавленные, изменённые и удалённые строки, а агрегаты
+        списков покупок меняет на разницу количеств. Возвращает новые строки
+        рецепта.
+        """
+        # Строка рецепта уже заблокирована его save(): параллельная правка
+        # дождётся конца транзакции и прочитает актуальные строки.
+        current = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        amounts = {
+            ingredient["id"].pk: ingredient["amount"] for ingredient in ingredients
+        }
+        created = [
+            RecipeIngredient(
+                recipe=recipe, ingredient=ingredient["id"], amount=ingredient["amount"]
+            )
+            for ingredient in ingredients
+            if ingredient["id"].pk not in current
+        ]
+        updated = []
+        changes = {row.ingredient_id: row.amount for row in created}
+        for ingredient_id, row in current.items():
+            amount = amounts.get(ingredient_id, 0)
+            if amount != row.amount:
+                changes[ingredient_id] = amount - row.amount
+                if amount:
+                    row.amount = amount
+                    updated.append(row)
+        if changes:
+            deleted = [current[pk].pk for pk in current.keys() - amounts.keys()]
+            if deleted:
+                RecipeIngredient.objects.filter(pk__in=deleted).delete()
+            if updated:
+                RecipeIngredient.objects.bulk_update(updated, ["amount"])
+            if created:
+                RecipeIngredient.objects.bulk_create(created)
+            shopping_cart.change_recipe(recipe.pk, changes)
+
+        for ingredient in ingredients:
+            row = current.get(ingredient["id"].pk)
+            if row is not None:
+                row.ingredient = ingredient["id"]
+        rows = [row for row in current.values() if row.ingredient_id in amounts]
+        return sorted(rows + created, key=lambda row: row.pk)
+
     def to_representation(self, instance):
+        recipe_ingredients = getattr(self, "recipe_ingredients", None)
+        if recipe_ingredients is None:
+            instance = Recipe.objects.with_related().get(pk=instance.pk)
+        else:
+            # Ответ собирается из записанных объектов без повторного чтения.
+            instance.ingredient_rows = recipe_ingredients
         return RecipeOutputSerializer(instance, context=self.context).data
@@ -0,0 +1,49 @@
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_txt(items):
+    for index, item in enumerate(items):
+        line = f"{item['name']} — {item['amount']} {item['measurement_unit']}"
+        yield f"\n{line}" if index else line
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("Ингредиент", "Количество", "Единица измерения"))
+    for item in items:
+        yield writer.writerow((item["name"], item["amount"], item["measurement_unit"]))
+
+
+def render_json(items):
+    yield "["
+    for index, item in enumerate(items):
+        yield ("," if index else "") + json.dumps(item, ensure_ascii=False)
+    yield "]"
+
+
+FILE_FORMATS = {
+    "txt": (render_txt, "text/plain"),
+    "csv": (render_csv, "text/csv"),
+    "json": (render_json, "application/json"),
+}
+
+
+def shopping_cart_response(items, file_format):
+    render, content_type = FILE_FORMATS[file_format]
+    response = StreamingHttpResponse(
+        render(items), content_type=f"{content_type}; charset=utf-8"
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="shopping_cart.{file_format}"'
+    )
+    return response
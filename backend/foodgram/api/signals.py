@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Recipe, RecipeIngredient
+
+from . import images
+from .cache import invalidate_recipes
+
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    invalidate_recipes([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredient(sender, instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_recipes(instance.recipes.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    if images.needs_processing(instance, "image"):
+        images.schedule(instance, "image")
+
+
+@receiver(post_save, sender=User)
+def process_avatar(sender, instance, **kwargs):
+    if images.needs_processing(instance, "avatar"):
+        images.schedule(instance, "avatar")
@@ -1,112 +1,252 @@
-import base64
+from collections import defaultdict
+from functools import partial
 
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404, HttpResponse
 
 from django_filters.rest_framework import DjangoFilterBackend
 
 from djoser.serializers import SetPasswordSerializer
 from djoser.views import UserViewSet
 
-from rest_framework import filters, permissions, status, viewsets
+from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
 
-from recipes.models import Featured, Ingredient, Recipe, RecipeIngredient, ShoppingList
-from users.models import Follow
+from recipes import bulk, timeline
+from recipes.models import (
+    Featured,
+    Ingredient,
+    Recipe,
+    ShoppingCartItem,
+    ShoppingList,
+)
 
+from .conditional import conditional_response, make_etag
+from .filters import RecipeFilter
+from .ingredients import ingredient_catalog, ingredient_index
+from .loaders import get_loader
+from .pagination import RecipePagination
+from .pantry import pantry_index
+from .parsers import ImageUploadParser
 from .permissions import AuthorOrReadOnly
+from .shopping_cart import FILE_FORMATS, shopping_cart_response
 from .serializers import (
+    AvatarSerializer,
     BaseUserSerializer,
+    BulkSerializer,
     ShortUserSerializer,
     CustomUserSerializer,
     IngredientSerializer,
+    PantryRecipeSerializer,
+    PantrySerializer,
     RecipeOutputSerializer,
     RecipeSerializer,
     ShortRecipeOutputSerializer,
-    FollowSerializer,
+    ShoppingCartItemSerializer,
+    get_recipes_limit,
 )
 
 
 User = get_user_model()
 
 
-class IngredientSearchFilter(filters.SearchFilter):
-    search_param = "name"
-
-
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ("^name",)
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if name:
+            limit = request.query_params.get("limit", "")
+            return Response(
+                ingredient_index.search(name, int(limit) if limit.isdigit() else None)
+            )
+        return self.snapshot_response(request, ingredient_catalog.get_catalog())
+
+    def retrieve(self, request, pk=None):
+        snapshot = None
+        if pk.isdigit():
+            snapshot = ingredient_catalog.get_detail(int(pk))
+        if snapshot is None:
+            raise Http404
+        return self.snapshot_response(request, snapshot)
+
+    def snapshot_response(self, request, snapshot):
+        content, etag = snapshot
+        return conditional_response(
+            request,
+            etag,
+            None,
+            lambda: HttpResponse(content, content_type="application/json"),
+        )
+
+
+UPLOAD_PARSERS = (JSONParser, MultiPartParser, FormParser, ImageUploadParser)
+
+
+def upload_data(request, field):
+    """Данные запроса с файлом в поле field.
+
+    Файл можно передать base64-строкой в JSON, полем multipart/form-data
+    или телом запроса с Content-Type: image/....
+    """
+    if "file" in request.FILES and field not in request.data:
+        return {field: request.FILES["file"]}
+    return request.data
+
+
+def bulk_response(request, add, remove):
+    """Добавление (POST) или удаление (DELETE) объектов из списка ids.
+
+    Для каждого id возвращается статус: added, exists, removed или
+    not_found.
+    """
+    serializer = BulkSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data["ids"]
+    with transaction.atomic():
+        if request.method == "POST":
+            statuses = {
+                obj.pk: "added" if obj.added else "exists"
+                for obj in add(request.user.pk, ids)
+            }
+        else:
+            statuses = dict.fromkeys(remove(request.user.pk, ids), "removed")
+    return Response([{"id": pk, "status": statuses.get(pk, "not_found")} for pk in ids])
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.with_related()
     permission_classes = (AuthorOrReadOnly,)
+    parser_classes = UPLOAD_PARSERS
     filter_backends = (DjangoFilterBackend,)
-    filterset_fields = ("author",)
-    pagination_class = LimitOffsetPagination
+    filterset_class = RecipeFilter
+    pagination_class = RecipePagination
 
     def handle_post_delete(self, request, pk, model, error_msg_exists):
+        # Каждое действие - один запрос; существование рецепта проверяется
+        # отдельно, только если удалять нечего.
         user = request.user
-        try:
-            recipe = Recipe.objects.get(pk=pk)
-        except Recipe.DoesNotExist:
+        if not pk.isdigit():
             return Response(
                 {"detail": "Страница не найдена."}, status=status.HTTP_404_NOT_FOUND
             )
 
         if request.method == "POST":
-            if model.objects.filter(user=user, recipe=recipe).exists():
+            with transaction.atomic():
+                recipes = bulk.add_recipes(model, user.pk, [int(pk)], columns="*")
+            if not recipes:
+                return Response(
+                    {"detail": "Страница не найдена."}, status=status.HTTP_404_NOT_FOUND
+                )
+            if not recipes[0].added:
                 return Response(
                     {"detail": error_msg_exists}, status=status.HTTP_400_BAD_REQUEST
                 )
-            model.objects.create(user=user, recipe=recipe)
             serializer = ShortRecipeOutputSerializer(
-                recipe, context={"request": request}
+                recipes[0], context={"request": request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         elif request.method == "DELETE":
-            obj = model.objects.filter(user=user, recipe=recipe).first()
-            if not obj:
+            with transaction.atomic():
+                removed = bulk.remove_recipes(model, user.pk, [int(pk)])
+            if removed:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            if not Recipe.objects.filter(pk=pk).exists():
                 return Response(
-                    {"detail": "Страница не найдена."},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    {"detail": "Страница не найдена."}, status=status.HTTP_404_NOT_FOUND
                 )
-            obj.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(
+                {"detail": "Страница не найдена."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
     def get_queryset(self):
-        queryset = super().get_queryset()
         user = self.request.user
+        queryset = super().get_queryset().with_user_flags(user)
 
         is_favorited = self.request.query_params.get("is_favorited")
-        if is_favorited is not None and user.is_authenticated:
-            if is_favorited == "1":
-                queryset = queryset.filter(in_featured__user=user)
-            elif is_favorited == "0":
-                queryset = queryset.exclude(in_featured__user=user)
+        if is_favorited in ("0", "1") and user.is_authenticated:
+            queryset = queryset.filter(is_favorited=is_favorited == "1")
 
         is_in_shopping_cart = self.request.query_params.get("is_in_shopping_cart")
-        if is_in_shopping_cart is not None and user.is_authenticated:
-            if is_in_shopping_cart == "1":
-                queryset = queryset.filter(in_shopping_list__user=user)
-            elif is_in_shopping_cart == "0":
-                queryset = queryset.exclude(in_shopping_list__user=user)
+        if is_in_shopping_cart in ("0", "1") and user.is_authenticated:
+            queryset = queryset.filter(is_in_shopping_cart=is_in_shopping_cart == "1")
+
+        search = self.request.query_params.get("search")
+        if search:
+            queryset = queryset.search(search)
+
+        if self.action == "feed":
+            # Сортировка по полям записи ленты использует ее индекс
+            # (user, -pub_date, -recipe), а не выборку по всем рецептам.
+            queryset = queryset.filter(timeline_entries__user=user).annotate(
+                feed_pub_date=F("timeline_entries__pub_date"),
+                feed_recipe_id=F("timeline_entries__recipe_id"),
+            )
+            if not search:
+                queryset = queryset.order_by("-feed_pub_date", "-feed_recipe_id")
         return queryset
 
+    @property
+    def keyset_fields(self):
+        if self.action == "feed":
+            return ("feed_pub_date", "feed_recipe_id")
+        return ("pub_date", "id")
+
     def get_serializer_class(self):
         if self.action in ("create", "update", "partial_update"):
             return RecipeSerializer
         return RecipeOutputSerializer
 
+    def get_version(self, recipe):
+        return (
+            recipe.pk,
+            recipe.updated_at,
+            recipe.author.updated_at,
+            recipe.is_favorited,
+            recipe.is_in_shopping_cart,
+            get_loader(self.request).is_subscribed(recipe.author_id),
+        )
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        etag = make_etag(
+            request,
+            self.paginator.count,
+            [self.get_version(recipe) for recipe in page],
+        )
+        last_modified = max(
+            (max(recipe.updated_at, recipe.author.updated_at) for recipe in page),
+            default=None,
+        )
+        return conditional_response(
+            request,
+            etag,
+            last_modified,
+            lambda: self.get_paginated_response(
+                self.get_serializer(page, many=True).data
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        return conditional_response(
+            request,
+            make_etag(request, self.get_version(recipe)),
+            max(recipe.updated_at, recipe.author.updated_at),
+            lambda: Response(self.get_serializer(recipe).data),
+            check_modified=not request.user.is_authenticated,
+        )
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -125,6 +265,27 @@ class RecipeViewSet(viewsets.ModelViewSet):
             error_msg_exists="Повторное добавление невозможно.",
         )
 
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="favorite",
+        url_name="favorite-bulk",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def favorite_bulk(self, request):
+        return bulk_response(
+            request,
+            partial(bulk.add_recipes, Featured),
+            partial(bulk.remove_recipes, Featured),
+        )
+
+    @action(
+        detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated]
+    )
+    def feed(self, request):
+        timeline.pull(request.user)
+        return self.list(request)
+
     @action(
         detail=False,
         methods=["get"],
@@ -132,29 +293,100 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def download_shopping_cart(self, request):
-        user = request.user
+        file_format = request.query_params.get("file_format", "txt")
+        if file_format not in FILE_FORMATS:
+            return Response(
+                {"detail": f"Допустимые форматы: {', '.join(FILE_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        recipes = Recipe.objects.filter(in_shopping_list__user=user)
+        ingredients = (
+            ShoppingCartItem.objects.filter(user=request.user)
+            .values(
+                "amount",
+                name=F("ingredient__name"),
+                measurement_unit=F("ingredient__measurement_unit"),
+            )
+            .order_by("name", "measurement_unit")
+        )
+        return shopping_cart_response(ingredients.iterator(), file_format)
 
-        ingredients = {}
-        recipe_ingredients = RecipeIngredient.objects.filter(recipe__in=recipes)
-        for item in recipe_ingredients:
-            name = item.ingredient.name
-            measurement_unit = item.ingredient.measurement_unit
-            key = (name, measurement_unit)
-            if key in ingredients:
-                ingredients[key] += item.amount
-            else:
-                ingredients[key] = item.amount
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="shopping_cart",
+        url_name="shopping-cart-list",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def shopping_cart_list(self, request):
+        items = (
+            ShoppingCartItem.objects.filter(user=request.user)
+            .select_related("ingredient")
+            .order_by("ingredient__name", "ingredient__measurement_unit")
+        )
+        serializer = ShoppingCartItemSerializer(items, many=True)
+        return Response(serializer.data)
 
-        list_item = []
-        for (name, measurement_unit), amount in ingredients.items():
-            list_item.append(f"{name} — {amount} {measurement_unit}")
-        file_content = "\n".join(list_item)
+    def shopping_cart_bulk(self, request):
+        return bulk_response(
+            request,
+            partial(bulk.add_recipes, ShoppingList),
+            partial(bulk.remove_recipes, ShoppingList),
+        )
 
-        response = HttpResponse(file_content, content_type="text/plain")
-        response["Content-Disposition"] = 'attachment; filename="shopping_cart.txt"'
-        return response
+    @shopping_cart_list.mapping.post
+    def shopping_cart_add(self, request):
+        return self.shopping_cart_bulk(request)
+
+    @shopping_cart_list.mapping.delete
+    def shopping_cart_remove(self, request):
+        # Список покупок очищается целиком только по явному {"all": true};
+        # остальные тела без корректного списка ids отклоняются.
+        if request.data == {"all": True}:
+            with transaction.atomic():
+                bulk.clear_shopping_list(request.user.pk)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.shopping_cart_bulk(request)
+
+    @action(detail=False, methods=["post"])
+    def pantry(self, request):
+        serializer = PantrySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        owned = set(serializer.validated_data["ingredients"])
+        matches = pantry_index.match(owned, serializer.validated_data["limit"])
+        recipes = Recipe.objects.with_related().in_bulk([pk for pk, _ in matches])
+        if len(recipes) < len(matches):
+            pantry_index.invalidate()
+
+        result = []
+        for pk, coverage in matches:
+            recipe = recipes.get(pk)
+            if recipe is None:
+                continue
+            recipe.coverage = coverage
+            recipe.missing = [
+                item
+                for item in recipe.recipe_ingredients.all()
+                if item.ingredient_id not in owned
+            ]
+            result.append(recipe)
+        return Response(
+            PantryRecipeSerializer(result, many=True, context={"request": request}).data
+        )
+
+    @action(detail=True, methods=["put"])
+    def image(self, request, pk=None):
+        recipe = self.get_object()
+        serializer = RecipeSerializer(
+            recipe,
+            data=upload_data(request, "image"),
+            partial=True,
+            context=self.get_serializer_context(),
+        )
+        serializer.is_valid(raise_exception=True)
+        recipe.image = serializer.validated_data["image"]
+        recipe.save()
+        return Response(serializer.data)
 
     @action(detail=True, methods=["get"], url_path="get-link")
     def get_link(self, request, pk=None):
@@ -176,6 +408,17 @@ class CustomUserViewSet(UserViewSet):
     def get_queryset(self):
         return User.objects.all()
 
+    def retrieve(self, request, *args, **kwargs):
+        user = self.get_object()
+        is_subscribed = get_loader(request).is_subscribed(user.pk)
+        return conditional_response(
+            request,
+            make_etag(request, user.pk, user.updated_at, is_subscribed),
+            user.updated_at,
+            lambda: Response(self.get_serializer(user).data),
+            check_modified=not request.user.is_authenticated,
+        )
+
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
         user = self.get_queryset().get(id=response.data["id"])
@@ -187,62 +430,84 @@ class CustomUserViewSet(UserViewSet):
         serializer = ShortUserSerializer(request.user, context={"request": request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-    @action(detail=False, methods=["put", "delete"], url_path="me/avatar")
+    @action(
+        detail=False,
+        methods=["put", "delete"],
+        url_path="me/avatar",
+        parser_classes=UPLOAD_PARSERS,
+    )
     def avatar(self, request):
         user = request.user
 
         if request.method == "PUT":
-            data = request.data.get("avatar")
-            try:
-                format, imgstr = data.split(";base64,")
-                ext = format.split("/")[-1]
-                data = ContentFile(base64.b64decode(imgstr), name="temp." + ext)
-            except (ValueError, AttributeError):
-                return Response(
-                    {"detail": "Invalid avatar"}, status=status.HTTP_400_BAD_REQUEST
-                )
+            serializer = AvatarSerializer(data=upload_data(request, "avatar"))
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            user.avatar.save(data.name, data)
+            user.avatar = serializer.validated_data["avatar"]
             user.save()
             avatar_url = request.build_absolute_uri(user.avatar.url)
             return Response({"avatar": avatar_url}, status=status.HTTP_200_OK)
 
         elif request.method == "DELETE":
-            user.avatar.delete(save=True)
+            # Файл удаляется вместе с последней ссылкой на него.
+            user.avatar = None
+            user.save()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=["post", "delete"], url_path="subscribe")
     def subscribe(self, request, id=None):
         user = request.user
-        try:
-            following = User.objects.get(pk=id)
-        except User.DoesNotExist:
+        if not id.isdigit():
             return Response(
                 {"detail": "Страница не найдена."}, status=status.HTTP_404_NOT_FOUND
             )
 
         if request.method == "POST":
-            serializer = FollowSerializer(
-                data={"user": user.id, "following": following.id}
-            )
-            if serializer.is_valid():
-                follow = Follow.objects.create(user=user, following=following)
-                user_serializer = CustomUserSerializer(
-                    following, context={"request": request}
+            if int(id) == user.pk:
+                return Response(
+                    {"non_field_errors": ["Нельзя подписаться на самого себя."]},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-                return Response(user_serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            with transaction.atomic():
+                authors = bulk.follow(user.pk, [int(id)], columns="*")
+            if not authors:
+                return Response(
+                    {"detail": "Страница не найдена."}, status=status.HTTP_404_NOT_FOUND
+                )
+            if not authors[0].added:
+                return Response(
+                    {"non_field_errors": ["Повторная подписка невозможна."]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            user_serializer = CustomUserSerializer(
+                authors[0], context={"request": request}
+            )
+            return Response(user_serializer.data, status=status.HTTP_201_CREATED)
 
         elif request.method == "DELETE":
-            follow = user.follower.filter(following=following).first()
-            if not follow:
+            with transaction.atomic():
+                removed = bulk.unfollow(user.pk, [int(id)])
+            if removed:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            if not User.objects.filter(pk=id).exists():
                 return Response(
-                    {"detail": "Страница не найдена."},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    {"detail": "Страница не найдена."}, status=status.HTTP_404_NOT_FOUND
                 )
-            follow.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(
+                {"detail": "Страница не найдена."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="subscribe",
+        url_name="subscribe-bulk",
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def subscribe_bulk(self, request):
+        return bulk_response(request, bulk.follow, bulk.unfollow)
 
     @action(
         detail=False,
@@ -259,6 +524,15 @@ class CustomUserViewSet(UserViewSet):
             followed_users, request, view=self
         )
 
+        previews = defaultdict(list)
+        for recipe in Recipe.objects.latest_per_author(
+            [followed.pk for followed in paginated_users],
+            get_recipes_limit(request),
+        ):
+            previews[recipe.author_id].append(recipe)
+        for followed in paginated_users:
+            followed.recipe_previews = previews[followed.pk]
+
         serializer = CustomUserSerializer(
             paginated_users, many=True, context={"request": request}
         )
@@ -0,0 +1,121 @@
+import os
+import posixpath
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from django.views.decorators.http import require_safe
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+RESIZED_DIR = "resized"
+
+# Примерный размер кеша в этом процессе; точный пересчитывается
+# при вытеснении.
+cache_size = None
+cache_lock = threading.Lock()
+
+
+def cache_root():
+    return os.path.join(settings.MEDIA_ROOT, RESIZED_DIR)
+
+
+def scan():
+    files = []
+    for directory, _, names in os.walk(cache_root()):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+    return files
+
+
+def evict():
+    """Удаляет давно не запрошенные файлы, пока кеш больше лимита.
+
+    Попадания отдаёт nginx, поэтому давность запроса - время доступа
+    к файлу (atime).
+    """
+    global cache_size
+    files = scan()
+    cache_size = sum(size for _, size, _ in files)
+    target = settings.RESIZED_IMAGE_CACHE_SIZE * 0.9
+    for _, size, path in sorted(files):
+        if cache_size <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        cache_size -= size
+
+
+def store(path, image, image_format):
+    global cache_size
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as file:
+        image.save(file, image_format)
+    os.replace(file.name, path)
+    with cache_lock:
+        if cache_size is None:
+            cache_size = sum(size for _, size, _ in scan())
+        else:
+            cache_size += os.path.getsize(path)
+        if cache_size > settings.RESIZED_IMAGE_CACHE_SIZE:
+            evict()
+
+
+def resize(source, size, path):
+    image_format = Image.registered_extensions().get(
+        posixpath.splitext(source)[1].lower()
+    )
+    if image_format is None:
+        raise Http404
+    try:
+        with default_storage.open(source) as file, Image.open(file) as image:
+            image.draft("RGB", size)
+            image = ImageOps.fit(ImageOps.exif_transpose(image), size)
+            if image_format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGB")
+            store(path, image, image_format)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        raise Http404
+
+
+def open_resized(source, size, path):
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        pass
+    resize(source, size, path)
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        # Файл успел вытеснить другой процесс.
+        raise Http404
+
+
+@require_safe
+def resized_image(request, width, height, path):
+    """Изображение из хранилища, обрезанное до одного из разрешённых размеров.
+
+    Результат остаётся в MEDIA_ROOT/resized/: следующие запросы отдаёт nginx.
+    """
+    size = (width, height)
+    source = posixpath.normpath(path)
+    if (
+        size not in settings.RESIZED_IMAGE_SIZES
+        or source.startswith(("/", "../", RESIZED_DIR + "/"))
+        or source == ".."
+    ):
+        raise Http404
+    target = os.path.join(cache_root(), f"{width}x{height}", source)
+    response = FileResponse(open_resized(source, size, target))
+    # Имена файлов в хранилище - хеши содержимого, поэтому ответ не меняется.
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
@@ -26,6 +26,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "django_filters",
     "rest_framework.authtoken",
@@ -79,6 +80,43 @@ DATABASES = {
 }
 
 
+# Cache
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+RECIPE_CACHE_TIMEOUT = 60 * 60
+
+INGREDIENT_INDEX_TTL = 5 * 60
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+# Лента подписок хранит не больше FEED_DEPTH рецептов на пользователя.
+# Рецепты авторов, у которых не меньше FEED_FANOUT_LIMIT подписчиков,
+# не раскладываются по лентам при публикации, а подтягиваются при чтении.
+FEED_DEPTH = 500
+
+FEED_FANOUT_LIMIT = 1000
+
+# Индекс «что приготовить» и подтягивание ленты читают изменения с отметки
+# времени; раз в SYNC_FULL_INTERVAL секунд данные перечитываются целиком.
+SYNC_FULL_INTERVAL = 15 * 60
+
+# Новые и изменённые рецепты попадают в индекс «что приготовить» с
+# задержкой до PANTRY_CHECK_INTERVAL секунд.
+PANTRY_CHECK_INTERVAL = 5
+
+# Потоков обработки изображений в каждом процессе; 0 - обрабатывать
+# сразу после фиксации транзакции в потоке запроса.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+
+
 # Password validation
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -118,6 +156,23 @@ STATIC_ROOT = BASE_DIR / "collected_static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = "/media"
 
+# Размеры (ширина, высота), в которых отдаются изображения из
+# /media/resized/<ширина>x<высота>/<путь>, и предельный объём их кеша.
+# Вытесняются файлы с самым старым временем доступа (atime): на томах,
+# смонтированных с relatime или noatime, оно обновляется редко или никогда,
+# и порядок вытеснения становится ближе к порядку создания файлов.
+RESIZED_IMAGE_SIZES = {(96, 96), (160, 160), (320, 240), (640, 480), (1280, 960)}
+
+RESIZED_IMAGE_CACHE_SIZE = int(os.getenv("RESIZED_IMAGE_CACHE_SIZE", 1024**3))
+
+# Загружаемые файлы сразу пишутся во временный файл по частям.
+FILE_UPLOAD_HANDLERS = ["django.core.files.uploadhandler.TemporaryFileUploadHandler"]
+
+STORAGES = {
+    "default": {"BACKEND": "foodgram.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
 # Default primary key field type
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - SHA-256 его содержимого.
+
+    Файл из upload_to/имя.ext сохраняется как upload_to/ab/cd/abcd....ext:
+    одинаковые загрузки хранятся один раз, а свободное имя не подбирается.
+    Учёт ссылок на файлы - в recipes.files.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        name = posixpath.join(directory, digest[:2], digest[2:4], digest + extension)
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Файл появляется под своим именем только целиком: одновременная
+        # загрузка того же содержимого просто заменит его таким же.
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(full_path), delete=False
+        ) as file:
+            for chunk in content.chunks():
+                file.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(file.name, self.file_permissions_mode)
+        os.replace(file.name, full_path)
+        return name
+
+
+class TrackedFilesModel(models.Model):
+    """Модель с файловыми полями tracked_files.
+
+    save() записывает только изменённые файловые поля, чтобы не затереть
+    результат фоновой обработки изображений устаревшим экземпляром, и
+    оставляет для обработчиков post_save списки changed_files (поля) и
+    replaced_files (прежние имена файлов из базы).
+
+    Поля external_fields меняются только через QuerySet.update() (счетчики
+    и т. п.), и save() без явного update_fields их не записывает: иначе
+    устаревший экземпляр затер бы чужие изменения.
+    """
+
+    tracked_files = ()
+    external_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_files = instance.file_names()
+        return instance
+
+    def file_names(self):
+        deferred = self.get_deferred_fields()
+        return {
+            field: getattr(self, field).name or ""
+            for field in self.tracked_files
+            if field not in deferred
+        }
+
+    def save(self, *args, update_fields=None, **kwargs):
+        loaded = getattr(self, "loaded_files", None)
+        if loaded is None:
+            changed = list(self.tracked_files)
+        else:
+            changed = [
+                field
+                for field, name in loaded.items()
+                if (getattr(self, field).name or "") != name
+            ]
+        if update_fields is not None:
+            changed = [field for field in changed if field in update_fields]
+        elif not self._state.adding:
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.external_fields
+                and (
+                    loaded is None or field.name not in loaded or field.name in changed
+                )
+            ]
+        self.changed_files = changed
+        self.replaced_files = []
+        if changed and not self._state.adding:
+            with transaction.atomic():
+                old = (
+                    type(self)
+                    ._base_manager.select_for_update()
+                    .filter(pk=self.pk)
+                    .values(*changed)
+                    .first()
+                )
+                self.replaced_files = [name for name in (old or {}).values() if name]
+                super().save(*args, update_fields=update_fields, **kwargs)
+        else:
+            super().save(*args, update_fields=update_fields, **kwargs)
+        self.loaded_files = self.file_names()
@@ -3,10 +3,17 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from .resize import resized_image
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("api.urls")),
+    path(
+        "media/resized/<int:width>x<int:height>/<path:path>",
+        resized_image,
+        name="resized-image",
+    ),
 ]
 
 if settings.DEBUG:
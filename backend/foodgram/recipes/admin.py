@@ -1,6 +1,18 @@
+from collections import Counter, defaultdict
+
 from django.contrib import admin
 
-from .models import Ingredient, Recipe, RecipeIngredient, Featured, ShoppingList
+from . import shopping_cart
+from .counters import recipe_counter_sum
+from .models import (
+    Ingredient,
+    Recipe,
+    RecipeCounter,
+    RecipeIngredient,
+    Featured,
+    ShoppingList,
+    ImageJob,
+)
 
 
 class RecipeAdmin(admin.ModelAdmin):
@@ -13,16 +25,86 @@ class RecipeAdmin(admin.ModelAdmin):
         "cooking_time",
         "pub_date",
         "featured_count",
+        "shopping_cart_count",
     )
     search_fields = ("author__username", "name")
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                favorites=recipe_counter_sum(RecipeCounter.FAVORITES),
+                shopping_carts=recipe_counter_sum(RecipeCounter.SHOPPING_CART),
+            )
+        )
+
     @admin.display(description="Ингредиенты")
     def get_ingredients(self, obj):
         return ", ".join([ingredient.name for ingredient in obj.ingredients.all()])
 
     @admin.display(description="Количество в избранном")
     def featured_count(self, obj):
-        return obj.in_featured.count()
+        return obj.favorites
+
+    @admin.display(description="Количество в списках покупок")
+    def shopping_cart_count(self, obj):
+        return obj.shopping_carts
+
+
+class RecipeIngredientAdmin(admin.ModelAdmin):
+    # Правки строк переносятся в индекс ингредиентов рецептов и в агрегаты
+    # списков покупок: сигналов для этого нет.
+
+    def apply(self, removed=(), added=()):
+        changes = defaultdict(Counter)
+        for sign, rows in ((-1, removed), (1, added)):
+            for recipe_id, ingredient_id, amount in rows:
+                changes[recipe_id][ingredient_id] += sign * amount
+        for recipe_id, recipe_changes in changes.items():
+            shopping_cart.change_recipe(
+                recipe_id,
+                {pk: change for pk, change in recipe_changes.items() if change},
+            )
+        Recipe.objects.filter(pk__in=changes).refresh_ingredient_ids()
+
+    def lock(self, recipe_ids):
+        # Рецепты блокируются на запись, как при их сохранении: параллельное
+        # добавление рецепта в список покупок дождется конца этой правки.
+        list(
+            Recipe.objects.select_for_update(no_key=True)
+            .filter(pk__in=recipe_ids)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+    def rows(self, queryset, recipe_ids=()):
+        self.lock({*queryset.values_list("recipe_id", flat=True), *recipe_ids})
+        return list(queryset.values_list("recipe_id", "ingredient_id", "amount"))
+
+    def save_model(self, request, obj, form, change):
+        old = []
+        if change:
+            old = self.rows(RecipeIngredient.objects.filter(pk=obj.pk), [obj.recipe_id])
+        else:
+            self.lock([obj.recipe_id])
+        super().save_model(request, obj, form, change)
+        self.apply(old, [(obj.recipe_id, obj.ingredient_id, obj.amount)])
+
+    def delete_model(self, request, obj):
+        old = self.rows(RecipeIngredient.objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+        self.apply(old)
+
+    def delete_queryset(self, request, queryset):
+        old = self.rows(queryset)
+        super().delete_queryset(request, queryset)
+        self.apply(old)
+
+
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ("label", "object_id", "field", "attempts", "error", "created_at")
+    list_filter = ("label", "attempts")
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -33,6 +115,8 @@ class IngredientAdmin(admin.ModelAdmin):
 admin.site.empty_value_display = "Не задано"
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
+admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
+admin.site.register(ImageJob, ImageJobAdmin)
 
 
-admin.site.register([RecipeIngredient, Featured, ShoppingList])
+admin.site.register([Featured, ShoppingList])
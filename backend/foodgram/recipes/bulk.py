@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from users.models import Follow
+
+from . import shopping_cart, timeline
+from .counters import change_recipe_counter, change_user_counter
+from .models import Featured, Recipe, RecipeCounter, ShoppingList
+
+
+# Добавление и удаление выполняются одним запросом в обход сигналов:
+# счетчики, агрегаты списков покупок и ленты обновляются здесь явно.
+# Повторы отсекают уникальные ограничения (ON CONFLICT DO NOTHING).
+
+COUNTER_KINDS = {
+    Featured: RecipeCounter.FAVORITES,
+    ShoppingList: RecipeCounter.SHOPPING_CART,
+}
+
+User = get_user_model()
+
+
+def insert_missing(model, column, target, user_id, ids, columns="id"):
+    # Вставляет строки (user_id, id) для существующих объектов target, которых
+    # еще нет у пользователя. Возвращает эти объекты с колонками columns и
+    # признаком added: добавлена ли строка.
+    return list(
+        target.objects.raw(
+            f"WITH requested AS (SELECT {columns} FROM {target._meta.db_table} "
+            "WHERE id = ANY(%s)), "
+            f"inserted AS (INSERT INTO {model._meta.db_table} (user_id, {column}) "
+            "SELECT %s, id FROM requested ON CONFLICT DO NOTHING "
+            f"RETURNING {column}) "
+            f"SELECT requested.*, inserted.{column} IS NOT NULL AS added "
+            f"FROM requested LEFT JOIN inserted ON inserted.{column} = requested.id",
+            [list(ids), user_id],
+        )
+    )
+
+
+def delete_existing(model, column, user_id, ids):
+    # Удаляет строки пользователя и возвращает id объектов удаленных строк.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {model._meta.db_table} WHERE user_id = %s AND {column} = ANY(%s) "
+            f"RETURNING {column}",
+            [user_id, list(ids)],
+        )
+        return [pk for (pk,) in cursor.fetchall()]
+
+
+def add_recipes(model, user_id, recipe_ids, columns="id"):
+    """Добавляет рецепты в избранное или список покупок пользователя.
+
+    Возвращает существующие рецепты из recipe_ids с признаком added.
+    """
+    recipes = insert_missing(model, "recipe_id", Recipe, user_id, recipe_ids, columns)
+    added = [recipe.pk for recipe in recipes if recipe.added]
+    change_recipe_counter(COUNTER_KINDS[model], added, 1)
+    if model is ShoppingList:
+        shopping_cart.add_user_recipes(user_id, added)
+    return recipes
+
+
+def remove_recipes(model, user_id, recipe_ids):
+    """Убирает рецепты из избранного или списка покупок пользователя.
+
+    Возвращает id убранных рецептов.
+    """
+    removed = delete_existing(model, "recipe_id", user_id, recipe_ids)
+    change_recipe_counter(COUNTER_KINDS[model], removed, -1)
+    if model is ShoppingList:
+        shopping_cart.remove_user_recipes(user_id, removed)
+    return set(removed)
+
+
+def clear_shopping_list(user_id):
+    """Очищает список покупок пользователя; возвращает число рецептов."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {ShoppingList._meta.db_table} WHERE user_id = %s "
+            "RETURNING recipe_id",
+            [user_id],
+        )
+        removed = [pk for (pk,) in cursor.fetchall()]
+    change_recipe_counter(RecipeCounter.SHOPPING_CART, removed, -1)
+    shopping_cart.clear(user_id)
+    return len(removed)
+
+
+def follow(user_id, author_ids, columns="id"):
+    """Подписывает пользователя на авторов.
+
+    Возвращает существующих авторов из author_ids, кроме самого
+    пользователя, с признаком added.
+    """
+    author_ids = [pk for pk in author_ids if pk != user_id]
+    authors = insert_missing(Follow, "following_id", User, user_id, author_ids, columns)
+    added = [author.pk for author in authors if author.added]
+    if added:
+        change_user_counter("followers_count", added, 1)
+        timeline.follow(user_id, added)
+    return authors
+
+
+def unfollow(user_id, author_ids):
+    """Отписывает пользователя от авторов; возвращает id бывших авторов."""
+    removed = delete_existing(Follow, "following_id", user_id, author_ids)
+    if removed:
+        change_user_counter("followers_count", removed, -1)
+        timeline.unfollow(user_id, removed)
+    return set(removed)
@@ -0,0 +1,77 @@
+import random
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F, Q, Subquery, Sum
+
+from .models import RecipeCounter
+
+
+COUNTER_SHARDS = 8
+
+User = get_user_model()
+
+
+def group_by_delta(ids, delta):
+    groups = {}
+    for pk, count in Counter(ids).items():
+        groups.setdefault(count * delta, []).append(pk)
+    return groups
+
+
+def change_user_counter(field, user_ids, delta):
+    """Изменяет поле-счетчик пользователей на delta за каждое вхождение id."""
+    for value, ids in group_by_delta(user_ids, delta).items():
+        User.objects.filter(pk__in=ids).update(**{field: F(field) + value})
+
+
+def change_recipe_counter(kind, recipe_ids, delta):
+    """Изменяет счетчик kind рецептов на delta за каждое вхождение id."""
+    groups = group_by_delta(recipe_ids, delta)
+    if not groups:
+        return
+    if delta > 0:
+        increment_recipe_counter(
+            kind, {pk: value for value, ids in groups.items() for pk in ids}
+        )
+    else:
+        for value, ids in groups.items():
+            decrement_recipe_counter(kind, ids, value)
+
+
+def increment_recipe_counter(kind, deltas):
+    # Строка шарда создается при первом обращении, поэтому вставка
+    # и прибавление выполняются одним upsert.
+    table = RecipeCounter._meta.db_table
+    values = ", ".join(["(%s, %s, %s, %s)"] * len(deltas))
+    params = []
+    for recipe_id, value in deltas.items():
+        params += [recipe_id, kind, random.randrange(COUNTER_SHARDS), value]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (recipe_id, kind, shard, value) "
+            f"VALUES {values} "
+            "ON CONFLICT (recipe_id, kind, shard) "
+            f"DO UPDATE SET value = {table}.value + EXCLUDED.value",
+            params,
+        )
+
+
+def decrement_recipe_counter(kind, recipe_ids, value):
+    # Уменьшается случайный существующий шард каждого рецепта. Новые строки
+    # не создаются: при каскадном удалении рецепта шардов может уже не быть.
+    shards = (
+        RecipeCounter.objects.filter(kind=kind, recipe_id__in=recipe_ids)
+        .order_by("recipe_id", "?")
+        .distinct("recipe_id")
+        .values("pk")
+    )
+    RecipeCounter.objects.filter(pk__in=Subquery(shards)).update(
+        value=F("value") + value
+    )
+
+
+def recipe_counter_sum(kind):
+    """Выражение для аннотации рецептов значением счетчика."""
+    return Sum("counters__value", filter=Q(counters__kind=kind), default=0)
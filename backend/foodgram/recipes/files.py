@@ -0,0 +1,58 @@
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from .models import StoredFile
+
+
+STORED_FILE = StoredFile._meta.db_table
+
+
+def acquire(names):
+    """Добавляет по ссылке на файл за каждое вхождение имени."""
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    values = ", ".join(["(%s, %s)"] * len(counts))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {STORED_FILE} (name, refcount) VALUES {values} "
+            "ON CONFLICT (name) "
+            f"DO UPDATE SET refcount = {STORED_FILE}.refcount + EXCLUDED.refcount",
+            [item for name_count in counts.items() for item in name_count],
+        )
+
+
+def release(names):
+    """Убирает ссылки на файлы; файлы без ссылок удаляются после фиксации."""
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    values = ", ".join(["(%s, %s)"] * len(counts))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {STORED_FILE} SET refcount = GREATEST("
+            f"{STORED_FILE}.refcount - released.count, 0) "
+            f"FROM (VALUES {values}) released (name, count) "
+            f"WHERE {STORED_FILE}.name = released.name",
+            [item for name_count in counts.items() for item in name_count],
+        )
+        cursor.execute(
+            f"DELETE FROM {STORED_FILE} WHERE refcount = 0 AND name IN "
+            f"({', '.join(['%s'] * len(counts))}) RETURNING name",
+            list(counts),
+        )
+        unused = [name for (name,) in cursor.fetchall()]
+    if unused:
+        transaction.on_commit(lambda: delete_unused(unused))
+
+
+def delete_unused(names):
+    # Файл могли загрузить заново, пока транзакция фиксировалась.
+    in_use = set(
+        StoredFile.objects.filter(name__in=names).values_list("name", flat=True)
+    )
+    for name in names:
+        if name not in in_use:
+            default_storage.delete(name)
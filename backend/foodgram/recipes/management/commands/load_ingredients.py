@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import DataVersion, Ingredient
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    reader = csv.reader(file)
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < 2:
+            raise CommandError(
+                f"Строка {reader.line_num}: ожидаются название и единица измерения."
+            )
+        yield row[0].strip(), row[1].strip()
+
+
+def read_json(file):
+    # Массив объектов разбирается по частям, без загрузки файла в память.
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise CommandError("Ожидается JSON-массив ингредиентов.")
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError("Файл JSON оборван.")
+            buffer += chunk
+            continue
+        yield item["name"].strip(), item["measurement_unit"].strip()
+        buffer = buffer[end:]
+
+
+READERS = {".csv": read_csv, ".json": read_json}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает ингредиенты из CSV (название,единица) или JSON. "
+        "Уже существующие пары название/единица пропускаются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--method",
+            choices=("auto", "copy", "bulk"),
+            default="auto",
+            help="copy - COPY во временную таблицу (только PostgreSQL), "
+            "bulk - пакетный bulk_create.",
+        )
+
+    def handle(self, path, batch_size, method, **options):
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError("Поддерживаются файлы .csv и .json.")
+        if method == "auto":
+            method = "copy" if connection.vendor == "postgresql" else "bulk"
+        elif method == "copy" and connection.vendor != "postgresql":
+            raise CommandError("COPY доступен только для PostgreSQL.")
+
+        started = time.monotonic()
+        with path.open(encoding="utf-8") as file, transaction.atomic():
+            load = self.load_copy if method == "copy" else self.load_bulk
+            total, created = load(batches(reader(file), batch_size))
+            DataVersion.objects.bump(DataVersion.INGREDIENTS)
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Прочитано строк: {total}, добавлено: {created}, "
+                f"{total / elapsed:.0f} строк/с."
+            )
+        )
+
+    def load_bulk(self, rows):
+        before = Ingredient.objects.count()
+        total = 0
+        for batch in rows:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit) for name, unit in batch),
+                ignore_conflicts=True,
+            )
+            total += len(batch)
+        return total, Ingredient.objects.count() - before
+
+    def load_copy(self, rows):
+        table = Ingredient._meta.db_table
+        total = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE ingredients_load "
+                "(name varchar(128), measurement_unit varchar(64)) ON COMMIT DROP"
+            )
+            for batch in rows:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    "COPY ingredients_load FROM STDIN WITH (FORMAT csv)", buffer
+                )
+                total += len(batch)
+            cursor.execute(
+                f"INSERT INTO {table} (name, measurement_unit) "
+                "SELECT DISTINCT name, measurement_unit FROM ingredients_load "
+                "ON CONFLICT (name, measurement_unit) DO NOTHING"
+            )
+            return total, cursor.rowcount
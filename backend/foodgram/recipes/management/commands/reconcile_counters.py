@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes import shopping_cart
+from recipes.counters import recipe_counter_sum
+from recipes.models import Featured, Recipe, RecipeCounter, ShoppingList
+from users.models import Follow
+
+
+User = get_user_model()
+
+
+def count_subquery(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает сохраненные счетчики рецептов и пользователей "
+        "и агрегаты списков покупок."
+    )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        users = User.objects.annotate(
+            actual_recipes=count_subquery(Recipe.objects.all(), "author"),
+            actual_followers=count_subquery(Follow.objects.all(), "following"),
+        )
+        fixed_users = 0
+        for user in users.iterator():
+            if (user.recipes_count, user.followers_count) != (
+                user.actual_recipes,
+                user.actual_followers,
+            ):
+                User.objects.filter(pk=user.pk).update(
+                    recipes_count=user.actual_recipes,
+                    followers_count=user.actual_followers,
+                )
+                fixed_users += 1
+
+        fixed_counters = 0
+        for model, kind in (
+            (Featured, RecipeCounter.FAVORITES),
+            (ShoppingList, RecipeCounter.SHOPPING_CART),
+        ):
+            recipes = Recipe.objects.annotate(
+                stored=recipe_counter_sum(kind),
+                actual=count_subquery(model.objects.all(), "recipe"),
+            )
+            for recipe in recipes.iterator():
+                if recipe.stored == recipe.actual:
+                    continue
+                RecipeCounter.objects.filter(recipe=recipe, kind=kind).delete()
+                if recipe.actual:
+                    RecipeCounter.objects.create(
+                        recipe=recipe, kind=kind, shard=0, value=recipe.actual
+                    )
+                fixed_counters += 1
+
+        carts = shopping_cart.mismatched_users()
+        shopping_cart.rebuild(carts)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Исправлено пользователей: {fixed_users}, "
+                f"счетчиков рецептов: {fixed_counters}, "
+                f"списков покупок: {len(carts)}."
+            )
+        )
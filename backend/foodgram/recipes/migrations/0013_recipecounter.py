@@ -0,0 +1,87 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model("users", "FoodgramUser")
+    Follow = apps.get_model("users", "Follow")
+    Recipe = apps.get_model("recipes", "Recipe")
+    RecipeCounter = apps.get_model("recipes", "RecipeCounter")
+
+    for row in Recipe.objects.values("author").annotate(count=Count("id")):
+        User.objects.filter(pk=row["author"]).update(recipes_count=row["count"])
+    for row in Follow.objects.values("following").annotate(count=Count("id")):
+        User.objects.filter(pk=row["following"]).update(followers_count=row["count"])
+    for model, kind in (("Featured", "favorites"), ("ShoppingList", "shopping_cart")):
+        rows = (
+            apps.get_model("recipes", model)
+            .objects.values("recipe")
+            .annotate(count=Count("id"))
+        )
+        RecipeCounter.objects.bulk_create(
+            RecipeCounter(
+                recipe_id=row["recipe"], kind=kind, shard=0, value=row["count"]
+            )
+            for row in rows
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0012_recipe_updated_at"),
+        ("users", "0012_foodgramuser_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("favorites", "Избранное"),
+                            ("shopping_cart", "Список покупок"),
+                        ],
+                        max_length=16,
+                        verbose_name="Счетчик",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField(verbose_name="Шард")),
+                ("value", models.IntegerField(default=0, verbose_name="Значение")),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="counters",
+                        to="recipes.recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "шард счетчика рецепта",
+                "verbose_name_plural": "Шарды счетчиков рецептов",
+                "ordering": ["id"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("recipe", "kind", "shard"),
+                        name="unique_recipe_counter_shard",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_shopping_carts(apps, schema_editor):
+    RecipeIngredient = apps.get_model("recipes", "RecipeIngredient")
+    ShoppingCartItem = apps.get_model("recipes", "ShoppingCartItem")
+    rows = (
+        RecipeIngredient.objects.filter(recipe__in_shopping_list__isnull=False)
+        .values("recipe__in_shopping_list__user", "ingredient")
+        .annotate(amount=Sum("amount"))
+    )
+    ShoppingCartItem.objects.bulk_create(
+        (
+            ShoppingCartItem(
+                user_id=row["recipe__in_shopping_list__user"],
+                ingredient_id=row["ingredient"],
+                amount=row["amount"],
+            )
+            for row in rows
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0013_recipecounter"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShoppingCartItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("amount", models.PositiveIntegerField(verbose_name="Количество")),
+                (
+                    "ingredient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="recipes.ingredient",
+                        verbose_name="Ингредиент",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_cart_items",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "ингредиент списка покупок",
+                "verbose_name_plural": "Ингредиенты списков покупок",
+                "ordering": ["id"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "ingredient"), name="unique_shopping_cart_item"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_shopping_carts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:24
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    Ingredient = apps.get_model("recipes", "Ingredient")
+    RecipeIngredient = apps.get_model("recipes", "RecipeIngredient")
+    ShoppingCartItem = apps.get_model("recipes", "ShoppingCartItem")
+    duplicates = (
+        Ingredient.objects.values("name", "measurement_unit")
+        .annotate(keep=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        others = Ingredient.objects.filter(
+            name=row["name"], measurement_unit=row["measurement_unit"]
+        ).exclude(pk=row["keep"])
+        RecipeIngredient.objects.filter(ingredient__in=others).update(
+            ingredient_id=row["keep"]
+        )
+        for item in ShoppingCartItem.objects.filter(ingredient__in=others):
+            kept, _ = ShoppingCartItem.objects.get_or_create(
+                user_id=item.user_id, ingredient_id=row["keep"], defaults={"amount": 0}
+            )
+            ShoppingCartItem.objects.filter(pk=kept.pk).update(
+                amount=F("amount") + item.amount
+            )
+            item.delete()
+        others.delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0014_shoppingcartitem"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="ingredient",
+            constraint=models.UniqueConstraint(
+                fields=("name", "measurement_unit"), name="unique_ingredient"
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:29
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import migrations, models
+
+
+def fill_ingredient_ids(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    RecipeIngredient = apps.get_model("recipes", "RecipeIngredient")
+    Recipe.objects.update(
+        ingredient_ids=ArraySubquery(
+            RecipeIngredient.objects.filter(recipe=models.OuterRef("pk"))
+            .order_by("ingredient_id")
+            .values("ingredient_id")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0016_recipe_search_vector"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="ingredient_ids",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(),
+                default=list,
+                editable=False,
+                size=None,
+                verbose_name="Идентификаторы ингредиентов",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["ingredient_ids"], name="recipe_ingredient_ids_idx"
+            ),
+        ),
+        migrations.RunPython(fill_ingredient_ids, migrations.RunPython.noop),
+    ]
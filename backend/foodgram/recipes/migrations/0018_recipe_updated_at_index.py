@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0017_recipe_ingredient_ids"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recipe",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, verbose_name="Дата и время изменения"
+            ),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_timelines(apps, schema_editor):
+    timeline = apps.get_model("recipes", "TimelineEntry")._meta.db_table
+    recipe = apps.get_model("recipes", "Recipe")._meta.db_table
+    follow = apps.get_model("users", "Follow")._meta.db_table
+    schema_editor.execute(
+        f"INSERT INTO {timeline} (user_id, recipe_id, pub_date) "
+        "SELECT user_id, id, pub_date FROM ("
+        "SELECT f.user_id, r.id, r.pub_date, ROW_NUMBER() OVER ("
+        "PARTITION BY f.user_id ORDER BY r.pub_date DESC, r.id DESC"
+        f") AS row_number FROM {follow} f "
+        f"JOIN {recipe} r ON r.author_id = f.following_id"
+        ") entries WHERE row_number <= %s",
+        [settings.FEED_DEPTH],
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0018_recipe_updated_at_index"),
+        ("users", "0013_foodgramuser_feed_pulled_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "pub_date",
+                    models.DateTimeField(verbose_name="Дата и время публикации"),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to="recipes.recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "запись ленты",
+                "verbose_name_plural": "Записи лент",
+                "ordering": ("-pub_date", "-recipe"),
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-pub_date", "-recipe"],
+                        name="timeline_user_pub_date_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "recipe"), name="unique_timeline_entry"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0019_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="image_medium",
+            field=models.ImageField(
+                blank=True,
+                editable=False,
+                upload_to="recipes_images",
+                verbose_name="Изображение среднего размера",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="image_thumb",
+            field=models.ImageField(
+                blank=True,
+                editable=False,
+                upload_to="recipes_images",
+                verbose_name="Миниатюра",
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:40
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    User = apps.get_model("users", "FoodgramUser")
+    StoredFile = apps.get_model("recipes", "StoredFile")
+    counts = Counter()
+    for model, fields in (
+        (Recipe, ("image", "image_thumb", "image_medium")),
+        (User, ("avatar", "avatar_thumb")),
+    ):
+        for names in model.objects.values_list(*fields).iterator():
+            counts.update(name for name in names if name)
+    StoredFile.objects.bulk_create(
+        (StoredFile(name=name, refcount=count) for name, count in counts.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0020_recipe_image_variants"),
+        ("users", "0014_foodgramuser_avatar_thumb"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredFile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=255, unique=True, verbose_name="Имя файла"
+                    ),
+                ),
+                ("refcount", models.PositiveIntegerField(verbose_name="Число ссылок")),
+            ],
+            options={
+                "verbose_name": "файл",
+                "verbose_name_plural": "Файлы",
+                "ordering": ["id"],
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:01
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    RecipeCounter = apps.get_model("recipes", "RecipeCounter")
+    RecipeIngredient = apps.get_model("recipes", "RecipeIngredient")
+    ShoppingCartItem = apps.get_model("recipes", "ShoppingCartItem")
+    for name, kind in (("Featured", "favorites"), ("ShoppingList", "shopping_cart")):
+        model = apps.get_model("recipes", name)
+        duplicates = (
+            model.objects.values("user", "recipe")
+            .annotate(keep=Min("id"), count=Count("id"))
+            .filter(count__gt=1)
+        )
+        for row in duplicates:
+            extra = row["count"] - 1
+            model.objects.filter(user=row["user"], recipe=row["recipe"]).exclude(
+                pk=row["keep"]
+            ).delete()
+            shard = RecipeCounter.objects.filter(
+                recipe=row["recipe"], kind=kind
+            ).first()
+            if shard is not None:
+                RecipeCounter.objects.filter(pk=shard.pk).update(
+                    value=F("value") - extra
+                )
+            if name != "ShoppingList":
+                continue
+            for item in RecipeIngredient.objects.filter(recipe=row["recipe"]):
+                ShoppingCartItem.objects.filter(
+                    user=row["user"], ingredient=item.ingredient_id
+                ).update(amount=F("amount") - item.amount * extra)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0021_storedfile"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="featured",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_featured"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="shoppinglist",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_shopping_list"
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0022_unique_featured_shopping_list"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataVersion",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=32,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Данные",
+                    ),
+                ),
+                ("value", models.UUIDField(verbose_name="Версия")),
+            ],
+            options={
+                "verbose_name": "версия данных",
+                "verbose_name_plural": "Версии данных",
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0023_dataversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("label", models.CharField(max_length=64, verbose_name="Модель")),
+                (
+                    "object_id",
+                    models.BigIntegerField(verbose_name="Идентификатор объекта"),
+                ),
+                ("field", models.CharField(max_length=32, verbose_name="Поле")),
+                (
+                    "name",
+                    models.CharField(blank=True, max_length=255, verbose_name="Файл"),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(default=0, verbose_name="Попыток"),
+                ),
+                (
+                    "error",
+                    models.TextField(blank=True, verbose_name="Последняя ошибка"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Создано"),
+                ),
+            ],
+            options={
+                "verbose_name": "обработка изображения",
+                "verbose_name_plural": "Обработка изображений",
+                "ordering": ["id"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("label", "object_id", "field"), name="unique_image_job"
+                    )
+                ],
+            },
+        ),
+    ]
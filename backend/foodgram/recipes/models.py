@@ -1,11 +1,31 @@
+import uuid
+
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.expressions import ArraySubquery
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField,
+)
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models.functions import Now, RowNumber
+
+from foodgram.storage import TrackedFilesModel
 
 
 MIN_NUMBER = 1
 MAX_NUMBER = 32000
 
+SEARCH_CONFIG = "russian"
+SEARCH_VECTOR = SearchVector("name", weight="A", config=SEARCH_CONFIG) + SearchVector(
+    "text", weight="B", config=SEARCH_CONFIG
+)
+
 User = get_user_model()
 
 
@@ -19,14 +39,89 @@ class Ingredient(models.Model):
         verbose_name = "ингредиент"
         verbose_name_plural = "Ингредиенты"
         ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=("name", "measurement_unit"), name="unique_ingredient"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.measurement_unit})"
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        """Подгружает автора и ингредиенты фиксированным числом запросов."""
+        return self.select_related("author").prefetch_related(
+            models.Prefetch(
+                "recipe_ingredients",
+                queryset=RecipeIngredient.objects.select_related("ingredient"),
+            )
+        )
+
+    def latest_per_author(self, author_ids, limit=None):
+        """Последние limit рецептов каждого из авторов одним запросом."""
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return queryset
+        return queryset.annotate(
+            row_number=models.Window(
+                RowNumber(),
+                partition_by=models.F("author_id"),
+                order_by=(models.F("pub_date").desc(), models.F("id").desc()),
+            )
+        ).filter(row_number__lte=limit)
+
+    def search(self, text):
+        """Полнотекстовый поиск по названию и описанию с ранжированием.
+
+        Добавляет к рецептам фрагмент описания с подсвеченными совпадениями.
+        """
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        return (
+            self.filter(search_vector=query)
+            .annotate(
+                rank=SearchRank(models.F("search_vector"), query),
+                search_snippet=SearchHeadline(
+                    "text", query, config=SEARCH_CONFIG, max_words=30, min_words=10
+                ),
+            )
+            .order_by("-rank", "-pub_date", "-id")
+        )
+
+    def refresh_ingredient_ids(self):
+        """Пересобирает индекс ингредиентов по таблице RecipeIngredient."""
+        return self.update(
+            ingredient_ids=ArraySubquery(
+                RecipeIngredient.objects.filter(recipe=models.OuterRef("pk"))
+                .order_by("ingredient_id")
+                .values("ingredient_id")
+            ),
+            updated_at=Now(),
+        )
+
+    def with_user_flags(self, user):
+        """Аннотирует рецепты признаками избранного и списка покупок."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Featured.objects.filter(user=user, recipe=models.OuterRef("pk"))
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingList.objects.filter(user=user, recipe=models.OuterRef("pk"))
+            ),
+        )
+
+
+class Recipe(TrackedFilesModel):
     """Рецепт."""
 
+    tracked_files = ("image", "image_thumb", "image_medium")
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -39,6 +134,15 @@ class Recipe(models.Model):
         help_text="Название, не более 256 символов",
     )
     image = models.ImageField(upload_to="recipes_images", verbose_name="Изображение")
+    image_thumb = models.ImageField(
+        upload_to="recipes_images", blank=True, editable=False, verbose_name="Миниатюра"
+    )
+    image_medium = models.ImageField(
+        upload_to="recipes_images",
+        blank=True,
+        editable=False,
+        verbose_name="Изображение среднего размера",
+    )
     text = models.TextField(verbose_name="Текстовое описание")
     ingredients = models.ManyToManyField(
         Ingredient, through="RecipeIngredient", verbose_name="Ингредиенты"
@@ -51,11 +155,30 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name="Дата и время публикации"
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, db_index=True, verbose_name="Дата и время изменения"
+    )
+    search_vector = SearchVectorField(
+        null=True, editable=False, verbose_name="Поисковый вектор"
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(),
+        default=list,
+        editable=False,
+        verbose_name="Идентификаторы ингредиентов",
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "рецепт"
         verbose_name_plural = "Рецепты"
-        ordering = ("-pub_date",)
+        ordering = ("-pub_date", "-id")
+        indexes = [
+            models.Index(fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"),
+            GinIndex(fields=["search_vector"], name="recipe_search_vector_idx"),
+            GinIndex(fields=["ingredient_ids"], name="recipe_ingredient_ids_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.author.get_username()}"
@@ -107,6 +230,11 @@ class ShoppingList(models.Model):
         verbose_name = "список покупок"
         verbose_name_plural = "Списки покупок"
         ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_shopping_list"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.get_username()} - {self.recipe.name}"
@@ -132,6 +260,199 @@ class Featured(models.Model):
         verbose_name = "избранное"
         verbose_name_plural = "Избранное"
         ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(fields=("user", "recipe"), name="unique_featured"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.get_username()} - {self.recipe.name}"
+
+
+class RecipeCounter(models.Model):
+    """Шард счетчика рецепта.
+
+    Значение счетчика - сумма по всем шардам: параллельные добавления
+    популярного рецепта обновляют разные строки и не ждут друг друга.
+    """
+
+    FAVORITES = "favorites"
+    SHOPPING_CART = "shopping_cart"
+    KINDS = (
+        (FAVORITES, "Избранное"),
+        (SHOPPING_CART, "Список покупок"),
+    )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name="Рецепт",
+        related_name="counters",
+    )
+    kind = models.CharField(max_length=16, choices=KINDS, verbose_name="Счетчик")
+    shard = models.PositiveSmallIntegerField(verbose_name="Шард")
+    value = models.IntegerField(default=0, verbose_name="Значение")
+
+    class Meta:
+        verbose_name = "шард счетчика рецепта"
+        verbose_name_plural = "Шарды счетчиков рецептов"
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=("recipe", "kind", "shard"), name="unique_recipe_counter_shard"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id} - {self.kind}[{self.shard}]: {self.value}"
+
+
+class ShoppingCartItem(models.Model):
+    """Сумма ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+        related_name="shopping_cart_items",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, verbose_name="Ингредиент"
+    )
+    amount = models.PositiveIntegerField(verbose_name="Количество")
+
+    class Meta:
+        verbose_name = "ингредиент списка покупок"
+        verbose_name_plural = "Ингредиенты списков покупок"
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "ingredient"), name="unique_shopping_cart_item"
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.user.get_username()} - {self.ingredient.name}: "
+            f"{self.amount} {self.ingredient.measurement_unit}"
+        )
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+        related_name="timeline_entries",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name="Рецепт",
+        related_name="timeline_entries",
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата и время публикации")
+
+    class Meta:
+        verbose_name = "запись ленты"
+        verbose_name_plural = "Записи лент"
+        ordering = ("-pub_date", "-recipe")
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_timeline_entry"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="timeline_user_pub_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.get_username()} - {self.recipe.name}"
+
+
+class StoredFile(models.Model):
+    """Число ссылок из моделей на файл в хранилище."""
+
+    name = models.CharField(max_length=255, unique=True, verbose_name="Имя файла")
+    refcount = models.PositiveIntegerField(verbose_name="Число ссылок")
+
+    class Meta:
+        verbose_name = "файл"
+        verbose_name_plural = "Файлы"
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.name}: {self.refcount}"
+
+
+class DataVersionQuerySet(models.QuerySet):
+    def get_value(self, name):
+        return self.filter(name=name).values_list("value", flat=True).first()
+
+    def bump(self, name):
+        """Меняет версию name в текущей транзакции.
+
+        Версия случайна: после отката транзакции она не повторяется.
+        """
+        self.bulk_create(
+            [self.model(name=name, value=uuid.uuid4())],
+            update_conflicts=True,
+            unique_fields=["name"],
+            update_fields=["value"],
+        )
+
+
+class DataVersion(models.Model):
+    """Версия данных, которые процессы держат в памяти.
+
+    Хранится в базе: изменение, сделанное любым процессом (в том числе
+    management-командой), видно всем остальным.
+    """
+
+    INGREDIENTS = "ingredients"
+
+    name = models.CharField(max_length=32, primary_key=True, verbose_name="Данные")
+    value = models.UUIDField(verbose_name="Версия")
+
+    objects = DataVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "версия данных"
+        verbose_name_plural = "Версии данных"
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class ImageJob(models.Model):
+    """Загруженное изображение, которое еще не обработано.
+
+    Строка пишется в транзакции загрузки и удаляется после обработки:
+    задания, потерянные при перезапуске процесса или завершившиеся
+    ошибкой, выполняет команда process_images.
+    """
+
+    label = models.CharField(max_length=64, verbose_name="Модель")
+    object_id = models.BigIntegerField(verbose_name="Идентификатор объекта")
+    field = models.CharField(max_length=32, verbose_name="Поле")
+    name = models.CharField(max_length=255, blank=True, verbose_name="Файл")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+
+    class Meta:
+        verbose_name = "обработка изображения"
+        verbose_name_plural = "Обработка изображений"
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=("label", "object_id", "field"), name="unique_image_job"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.label} {self.object_id}: {self.field}"
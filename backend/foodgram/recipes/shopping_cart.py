@@ -0,0 +1,170 @@
+from django.db import connection
+
+from .models import Recipe, RecipeIngredient, ShoppingCartItem, ShoppingList
+
+
+CART = ShoppingCartItem._meta.db_table
+RECIPE = Recipe._meta.db_table
+SHOPPING_LIST = ShoppingList._meta.db_table
+RECIPE_INGREDIENT = RecipeIngredient._meta.db_table
+
+
+def cart_delta(condition):
+    # Ингредиенты выбранных строк списка покупок, сгруппированные так же,
+    # как хранится агрегат: по пользователю и ингредиенту.
+    return (
+        "SELECT sl.user_id, ri.ingredient_id, SUM(ri.amount) AS amount "
+        f"FROM {SHOPPING_LIST} sl "
+        f"JOIN {RECIPE_INGREDIENT} ri ON ri.recipe_id = sl.recipe_id "
+        f"WHERE {condition} "
+        "GROUP BY sl.user_id, ri.ingredient_id"
+    )
+
+
+def recipe_delta(amounts):
+    # То же для произвольных количеств ингредиентов во всех списках
+    # с рецептом; параметры - пары из amounts, затем id рецепта.
+    values = ", ".join(["(%s::bigint, %s::bigint)"] * len(amounts))
+    return (
+        "SELECT sl.user_id, d.ingredient_id, SUM(d.amount) AS amount "
+        f"FROM {SHOPPING_LIST} sl CROSS JOIN (VALUES {values}) d (ingredient_id, amount) "
+        "WHERE sl.recipe_id = %s "
+        "GROUP BY sl.user_id, d.ingredient_id"
+    )
+
+
+def user_delta():
+    # Ингредиенты рецептов одного пользователя по массиву id рецептов:
+    # строки списка покупок к этому моменту уже могут быть удалены.
+    return (
+        "SELECT %s::bigint AS user_id, ri.ingredient_id, SUM(ri.amount) AS amount "
+        "FROM unnest(%s::bigint[]) sl (recipe_id) "
+        f"JOIN {RECIPE_INGREDIENT} ri ON ri.recipe_id = sl.recipe_id "
+        "GROUP BY ri.ingredient_id"
+    )
+
+
+def add(delta, params):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {CART} (user_id, ingredient_id, amount) "
+            f"{delta} "
+            "ON CONFLICT (user_id, ingredient_id) "
+            f"DO UPDATE SET amount = {CART}.amount + EXCLUDED.amount",
+            params,
+        )
+
+
+def remove(delta, params):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {CART} SET amount = {CART}.amount - delta.amount "
+            f"FROM ({delta}) delta "
+            f"WHERE {CART}.user_id = delta.user_id "
+            f"AND {CART}.ingredient_id = delta.ingredient_id",
+            params,
+        )
+        cursor.execute(
+            f"DELETE FROM {CART} WHERE amount = 0 AND user_id IN "
+            f"(SELECT delta.user_id FROM ({delta}) delta)",
+            params,
+        )
+
+
+def lock_recipes(condition, params):
+    # FOR SHARE конфликтует с блокировкой строки рецепта при его сохранении:
+    # правка ингредиентов рецепта (change_recipe) и перенос рецепта в агрегат
+    # или из него выполняются по очереди, и ни одна сторона не читает
+    # устаревшие строки другой.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id FROM {RECIPE} WHERE {condition} ORDER BY id FOR SHARE", params
+        )
+
+
+def id_condition(ids):
+    return f"sl.id IN ({', '.join(['%s'] * len(ids))})"
+
+
+def lock_shopping_list_recipes(shopping_list_ids):
+    lock_recipes(
+        f"id IN (SELECT sl.recipe_id FROM {SHOPPING_LIST} sl "
+        f"WHERE {id_condition(shopping_list_ids)})",
+        list(shopping_list_ids),
+    )
+
+
+def add_shopping_lists(shopping_list_ids):
+    """Прибавляет рецепты из строк списка покупок к агрегатам владельцев."""
+    if shopping_list_ids:
+        lock_shopping_list_recipes(shopping_list_ids)
+        add(cart_delta(id_condition(shopping_list_ids)), list(shopping_list_ids))
+
+
+def remove_shopping_lists(shopping_list_ids):
+    """Вычитает рецепты из агрегатов; вызывается до удаления строк."""
+    if shopping_list_ids:
+        lock_shopping_list_recipes(shopping_list_ids)
+        remove(cart_delta(id_condition(shopping_list_ids)), list(shopping_list_ids))
+
+
+def add_user_recipes(user_id, recipe_ids):
+    """Прибавляет рецепты к агрегату пользователя (каждое вхождение id)."""
+    if recipe_ids:
+        lock_recipes("id = ANY(%s)", [list(recipe_ids)])
+        add(user_delta(), [user_id, list(recipe_ids)])
+
+
+def remove_user_recipes(user_id, recipe_ids):
+    """Вычитает рецепты из агрегата пользователя (каждое вхождение id)."""
+    if recipe_ids:
+        lock_recipes("id = ANY(%s)", [list(recipe_ids)])
+        remove(user_delta(), [user_id, list(recipe_ids)])
+
+
+def clear(user_id):
+    """Очищает агрегат пользователя."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {CART} WHERE user_id = %s", [user_id])
+
+
+def mismatched_users():
+    """Пользователи, чьи агрегаты расходятся со списками покупок."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT COALESCE(actual.user_id, {CART}.user_id) "
+            f"FROM ({cart_delta('TRUE')}) actual "
+            f"FULL JOIN {CART} ON {CART}.user_id = actual.user_id "
+            f"AND {CART}.ingredient_id = actual.ingredient_id "
+            f"WHERE actual.amount IS DISTINCT FROM {CART}.amount"
+        )
+        return [user_id for (user_id,) in cursor.fetchall()]
+
+
+def rebuild(user_ids):
+    """Пересобирает агрегаты пользователей по их спискам покупок."""
+    if not user_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {CART} WHERE user_id = ANY(%s)", [list(user_ids)])
+    add(cart_delta("sl.user_id = ANY(%s)"), [list(user_ids)])
+
+
+def change_recipe(recipe_id, changes):
+    """Применяет к спискам с рецептом изменение его ингредиентов.
+
+    changes - {id ингредиента: разница количеств}; уменьшения вычитаются
+    отдельно, иначе отрицательная строка нарушит проверку amount >= 0.
+    Строка рецепта к этому моменту должна быть заблокирована на запись.
+    """
+    for sign, apply in ((1, add), (-1, remove)):
+        amounts = [
+            (ingredient_id, sign * change)
+            for ingredient_id, change in changes.items()
+            if sign * change > 0
+        ]
+        if amounts:
+            apply(
+                recipe_delta(amounts),
+                [value for pair in amounts for value in pair] + [recipe_id],
+            )
@@ -0,0 +1,107 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import Follow
+
+from . import files, shopping_cart, timeline
+from .counters import change_recipe_counter, change_user_counter
+from .models import (
+    SEARCH_VECTOR,
+    DataVersion,
+    Featured,
+    Ingredient,
+    Recipe,
+    RecipeCounter,
+    ShoppingList,
+)
+
+
+User = get_user_model()
+
+COUNTER_KINDS = {
+    Featured: RecipeCounter.FAVORITES,
+    ShoppingList: RecipeCounter.SHOPPING_CART,
+}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    DataVersion.objects.bump(DataVersion.INGREDIENTS)
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(sender, instance, created, **kwargs):
+    if created:
+        change_user_counter("recipes_count", [instance.author_id], 1)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_created_recipe(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {"name", "text"} & set(update_fields):
+        Recipe.objects.filter(pk=instance.pk).update(search_vector=SEARCH_VECTOR)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    change_user_counter("recipes_count", [instance.author_id], -1)
+
+
+@receiver(post_save, sender=Featured)
+@receiver(post_save, sender=ShoppingList)
+def count_added_recipe(sender, instance, created, **kwargs):
+    if created:
+        change_recipe_counter(COUNTER_KINDS[sender], [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Featured)
+@receiver(post_delete, sender=ShoppingList)
+def count_removed_recipe(sender, instance, **kwargs):
+    change_recipe_counter(COUNTER_KINDS[sender], [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=ShoppingList)
+def add_to_shopping_cart(sender, instance, created, **kwargs):
+    if created:
+        shopping_cart.add_shopping_lists([instance.pk])
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def remove_from_shopping_cart(sender, instance, **kwargs):
+    # До удаления: строка списка и ингредиенты рецепта еще существуют,
+    # в том числе при каскадном удалении самого рецепта.
+    shopping_cart.remove_shopping_lists([instance.pk])
+
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(sender, instance, created, **kwargs):
+    if created:
+        change_user_counter("followers_count", [instance.following_id], 1)
+        timeline.follow(instance.user_id, [instance.following_id])
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    change_user_counter("followers_count", [instance.following_id], -1)
+    timeline.unfollow(instance.user_id, [instance.following_id])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def update_file_references(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    files.acquire(getattr(instance, field).name for field in instance.changed_files)
+    files.release(instance.replaced_files)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def release_files(sender, instance, **kwargs):
+    files.release(instance.file_names().values())
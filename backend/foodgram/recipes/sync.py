@@ -0,0 +1,28 @@
+import datetime as dt
+
+from django.conf import settings
+from django.utils import timezone
+
+
+# Изменение из долгой транзакции становится видимым позже изменений с более
+# поздней отметкой времени. Чтение с отметки поэтому захватывает
+# SYNC_OVERLAP назад, а транзакции длиннее этого запаса подбирает полное
+# перечитывание раз в SYNC_FULL_INTERVAL.
+SYNC_OVERLAP = dt.timedelta(minutes=1)
+
+
+def full_read_due(full_read_at):
+    """Пора ли перечитать данные целиком после полного чтения full_read_at."""
+    return full_read_at is None or timezone.now() - full_read_at > dt.timedelta(
+        seconds=settings.SYNC_FULL_INTERVAL
+    )
+
+
+def read_from(mark, full_read_at):
+    """Нижняя граница отметок для чтения изменений после mark.
+
+    None - читать все: отметки еще нет или пора полное чтение.
+    """
+    if mark is None or full_read_due(full_read_at):
+        return None
+    return mark - SYNC_OVERLAP
@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from users.models import Follow
+
+from . import sync
+from .models import Recipe, TimelineEntry
+
+
+TIMELINE = TimelineEntry._meta.db_table
+FOLLOW = Follow._meta.db_table
+RECIPE = Recipe._meta.db_table
+
+User = get_user_model()
+USER = User._meta.db_table
+
+
+def trim(user_ids):
+    """Оставляет в лентах пользователей FEED_DEPTH самых новых рецептов."""
+    if not user_ids:
+        return
+    extra = (
+        TimelineEntry.objects.filter(user_id__in=user_ids)
+        .annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F("user_id"),
+                order_by=(F("pub_date").desc(), F("recipe_id").desc()),
+            )
+        )
+        .filter(row_number__gt=settings.FEED_DEPTH)
+        .values_list("pk", flat=True)
+    )
+    TimelineEntry.objects.filter(pk__in=list(extra)).delete()
+
+
+def fan_out(recipe):
+    """Раскладывает новый рецепт по лентам подписчиков автора.
+
+    Рецепты авторов с FEED_FANOUT_LIMIT подписчиков и больше не
+    раскладываются: подписчики подтягивают их сами (см. pull).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {TIMELINE} (user_id, recipe_id, pub_date) "
+            f"SELECT f.user_id, %s, %s FROM {FOLLOW} f "
+            f"JOIN {USER} a ON a.id = f.following_id "
+            "WHERE f.following_id = %s AND a.followers_count < %s "
+            "ON CONFLICT (user_id, recipe_id) DO NOTHING "
+            "RETURNING user_id",
+            [recipe.pk, recipe.pub_date, recipe.author_id, settings.FEED_FANOUT_LIMIT],
+        )
+        trim([user_id for (user_id,) in cursor.fetchall()])
+
+
+def pull(user):
+    """Добавляет в ленту новые рецепты популярных авторов из подписок.
+
+    Отметка feed_pulled_at сдвигается, только если рецепты добавлены.
+    """
+    if not Follow.objects.filter(
+        user=user, following__followers_count__gte=settings.FEED_FANOUT_LIMIT
+    ).exists():
+        return
+    pulled_at = timezone.now()
+    full_pull_key = f"feed-full-pull:{user.pk}"
+    since = sync.read_from(user.feed_pulled_at, cache.get(full_pull_key))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {TIMELINE} (user_id, recipe_id, pub_date) "
+            f"SELECT f.user_id, r.id, r.pub_date FROM {FOLLOW} f "
+            f"JOIN {USER} a ON a.id = f.following_id "
+            f"JOIN {RECIPE} r ON r.author_id = a.id "
+            "WHERE f.user_id = %s AND a.followers_count >= %s "
+            "AND (%s::timestamptz IS NULL OR r.pub_date > %s) "
+            "ORDER BY r.pub_date DESC, r.id DESC LIMIT %s "
+            "ON CONFLICT (user_id, recipe_id) DO NOTHING",
+            [user.pk, settings.FEED_FANOUT_LIMIT, since, since, settings.FEED_DEPTH],
+        )
+        added = cursor.rowcount
+    if since is None:
+        cache.set(full_pull_key, pulled_at, None)
+    if added:
+        User.objects.filter(pk=user.pk).update(feed_pulled_at=pulled_at)
+        user.feed_pulled_at = pulled_at
+        trim([user.pk])
+
+
+def follow(user_id, author_ids):
+    """Добавляет в ленту подписчика последние рецепты новых авторов."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {TIMELINE} (user_id, recipe_id, pub_date) "
+            f"SELECT %s, r.id, r.pub_date FROM {RECIPE} r "
+            "WHERE r.author_id = ANY(%s) "
+            "ORDER BY r.pub_date DESC, r.id DESC LIMIT %s "
+            "ON CONFLICT (user_id, recipe_id) DO NOTHING",
+            [user_id, list(author_ids), settings.FEED_DEPTH],
+        )
+        added = cursor.rowcount
+    if added:
+        trim([user_id])
+
+
+def unfollow(user_id, author_ids):
+    """Убирает из ленты бывшего подписчика рецепты авторов."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, recipe__author_id__in=author_ids
+    ).delete()
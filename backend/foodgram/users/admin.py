@@ -4,7 +4,15 @@ from .models import FoodgramUser, Follow
 
 
 class FoodgramUserAdmin(admin.ModelAdmin):
-    list_display = ("email", "username", "first_name", "last_name", "avatar")
+    list_display = (
+        "email",
+        "username",
+        "first_name",
+        "last_name",
+        "avatar",
+        "recipes_count",
+        "followers_count",
+    )
     search_fields = ("email", "username")
 
 
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0010_alter_follow_options"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="foodgramuser",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, verbose_name="Дата и время изменения"
+            ),
+        ),
+    ]
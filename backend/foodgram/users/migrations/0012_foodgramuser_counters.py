@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0011_foodgramuser_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="foodgramuser",
+            name="followers_count",
+            field=models.IntegerField(
+                default=0, editable=False, verbose_name="Количество подписчиков"
+            ),
+        ),
+        migrations.AddField(
+            model_name="foodgramuser",
+            name="recipes_count",
+            field=models.IntegerField(
+                default=0, editable=False, verbose_name="Количество рецептов"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0012_foodgramuser_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="foodgramuser",
+            name="feed_pulled_at",
+            field=models.DateTimeField(
+                editable=False,
+                null=True,
+                verbose_name="Дата и время обновления ленты популярными авторами",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0013_foodgramuser_feed_pulled_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="foodgramuser",
+            name="avatar_thumb",
+            field=models.ImageField(
+                blank=True,
+                editable=False,
+                upload_to="users_images",
+                verbose_name="Миниатюра аватара",
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:01
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    Follow = apps.get_model("users", "Follow")
+    FoodgramUser = apps.get_model("users", "FoodgramUser")
+    TimelineEntry = apps.get_model("recipes", "TimelineEntry")
+    self_follows = Follow.objects.filter(user=F("following"))
+    for follow in self_follows:
+        FoodgramUser.objects.filter(pk=follow.user_id).update(
+            followers_count=F("followers_count") - 1
+        )
+        TimelineEntry.objects.filter(
+            user=follow.user_id, recipe__author=follow.user_id
+        ).delete()
+    self_follows.delete()
+    duplicates = (
+        Follow.objects.values("user", "following")
+        .annotate(keep=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        Follow.objects.filter(user=row["user"], following=row["following"]).exclude(
+            pk=row["keep"]
+        ).delete()
+        FoodgramUser.objects.filter(pk=row["following"]).update(
+            followers_count=F("followers_count") - (row["count"] - 1)
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0014_foodgramuser_avatar_thumb"),
+        ("recipes", "0019_timelineentry"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="follow",
+            constraint=models.UniqueConstraint(
+                fields=("user", "following"), name="unique_follow"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="follow",
+            constraint=models.CheckConstraint(
+                condition=models.Q(("user", models.F("following")), _negated=True),
+                name="prevent_self_follow",
+            ),
+        ),
+    ]
@@ -2,8 +2,10 @@ from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from django.db import models
 
+from foodgram.storage import TrackedFilesModel
 
-class FoodgramUser(AbstractUser):
+
+class FoodgramUser(TrackedFilesModel, AbstractUser):
     email = models.EmailField(
         max_length=254,
         unique=True,
@@ -28,6 +30,29 @@ class FoodgramUser(AbstractUser):
     avatar = models.ImageField(
         upload_to="users_images", blank=True, null=True, verbose_name="Аватар"
     )
+    avatar_thumb = models.ImageField(
+        upload_to="users_images",
+        blank=True,
+        editable=False,
+        verbose_name="Миниатюра аватара",
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name="Дата и время изменения"
+    )
+    recipes_count = models.IntegerField(
+        default=0, editable=False, verbose_name="Количество рецептов"
+    )
+    followers_count = models.IntegerField(
+        default=0, editable=False, verbose_name="Количество подписчиков"
+    )
+    feed_pulled_at = models.DateTimeField(
+        null=True,
+        editable=False,
+        verbose_name="Дата и время обновления ленты популярными авторами",
+    )
+
+    tracked_files = ("avatar", "avatar_thumb")
+    external_fields = ("recipes_count", "followers_count", "feed_pulled_at")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "password"]
@@ -61,6 +86,13 @@ class Follow(models.Model):
         verbose_name = "подписка"
         verbose_name_plural = "Подписки"
         ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(fields=("user", "following"), name="unique_follow"),
+            models.CheckConstraint(
+                condition=~models.Q(user=models.F("following")),
+                name="prevent_self_follow",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.get_username()} - {self.following.get_username()}"